@@ -7,101 +7,1551 @@ Uso:
     python profile_endpoint.py --url http://localhost:8000/api/users --requests 100
     python profile_endpoint.py --url http://localhost:8000/api/users --requests 50 --concurrent 10
     python profile_endpoint.py --url http://localhost:8000/health --requests 200 --method GET
+    python profile_endpoint.py --url http://localhost:8000/health --requests 100000 --concurrent 1000 --engine async
+    python profile_endpoint.py --url https://localhost:8443/api/chat/stream --requests 500 --concurrent 100 --engine http2
+    python profile_endpoint.py --url http://localhost:8000/api/users --requests 6000 --rate 100/s --concurrent 200
+    python profile_endpoint.py --url http://localhost:8000/health --requests 1000000 --concurrent 2000 --engine async --workers 8
+    python profile_endpoint.py --url http://localhost:8000/api/users --requests 360000 --rate 200/s --warmup 30s --timeseries soak.csv
+    python profile_endpoint.py --scenario scenario.yaml --requests 5000 --concurrent 50 --engine async
+    python profile_endpoint.py --url http://localhost:8000/api/users --requests 6000 --rate 100/s --save-baseline perf/users.json
+    python profile_endpoint.py --url http://localhost:8000/api/users --requests 6000 --rate 100/s --baseline perf/users.json --max-regression 10
+    python profile_endpoint.py --url http://localhost:8000/api/users --requests 2000 --concurrent 20 --server-profile perf/users.collapsed
+
+Escenario (YAML, requiere PyYAML; o el mismo contenido en JSON):
+    name: "api-users"
+    base_url: "http://localhost:8000"
+    headers:
+      Authorization: "Bearer ${API_TOKEN}"    # ${VAR} = variable de entorno
+    variables:
+      user_id: [1, 2, 3]                      # Lista = un valor al azar por request
+    think_time: [0.1, 0.5]                    # Segundos (o [min, max]) entre requests de un worker
+    endpoints:
+      - name: list_users
+        path: "/api/users?page=1"
+        weight: 5
+      - name: user_detail
+        path: "/api/users/{{user_id}}"        # {{seq}} y {{uuid}} también disponibles
+        weight: 3
+      - name: create_user
+        method: POST
+        path: "/api/users"
+        json: {name: "user-{{seq}}", role_id: "{{user_id}}"}
+        weight: 1
+
+Fases: cada request registra DNS, connect, TLS (solo al abrir conexión), TTFB
+(desde el inicio hasta el primer byte de la respuesta) y transferencia; las
+respuestas streaming (chunked / SSE) además el primer chunk y el gap entre
+chunks. Cada fase tiene su propio histograma. El engine http2 requiere httpx
+con soporte HTTP/2 (pip install "httpx[http2]").
+
+--server-profile requiere un backend con PROFILING_ENABLED=true (template
+backend-python); el token se toma de la variable de entorno PROFILING_TOKEN.
 """
 
 import argparse
 import asyncio
+import base64
+import csv
+import http.client
 import json
-import statistics
+import math
+import multiprocessing
+import os
+import random
+import re
+import socket
+import ssl
 import sys
+import threading
 import time
+import urllib.parse
+import uuid
 import urllib.request
-from concurrent.futures import ThreadPoolExecutor
+import urllib.error
 from datetime import datetime
 
 
-def single_request(url: str, method: str = "GET", timeout: int = 30) -> dict:
-    """Ejecuta un request y mide tiempo de respuesta."""
+class LatencyHistogram:
+    """
+    Histograma log-lineal estilo HDR de valores enteros (microsegundos).
+
+    Cada potencia de 2 se divide en sub-buckets lineales, así el error
+    relativo de cualquier valor queda acotado por `significant_digits`
+    (2 → <1%) y la memoria depende del rango, no de la cantidad de muestras.
+    Dos histogramas con la misma precisión se pueden sumar (`merge`) y
+    serializar a JSON (`to_dict` / `from_dict`).
+    """
+
+    def __init__(self, significant_digits: int = 2):
+        self.significant_digits = significant_digits
+        self.sub_bucket_bits = math.ceil(math.log2(2 * 10 ** significant_digits))
+        self.sub_bucket_count = 1 << self.sub_bucket_bits
+        self.sub_bucket_half = self.sub_bucket_count // 2
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.total_sq = 0
+        self.min = None
+        self.max = None
+
+    def record(self, value: int, count: int = 1):
+        value = max(int(value), 0)
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.count += count
+        self.total += value * count
+        self.total_sq += value * value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def _index(self, value: int) -> int:
+        if value < self.sub_bucket_count:
+            return value
+        shift = value.bit_length() - self.sub_bucket_bits
+        return shift * self.sub_bucket_half + (value >> shift)
+
+    def _bounds(self, index: int) -> tuple:
+        """Rango [lower, upper] de valores que caen en el bucket `index`."""
+        if index < self.sub_bucket_count:
+            return index, index
+        shift = index // self.sub_bucket_half - 1
+        mantissa = index - shift * self.sub_bucket_half
+        return mantissa << shift, ((mantissa + 1) << shift) - 1
+
+    def percentile(self, p: float) -> int:
+        """Valor en el percentil `p` (0-100), acotado por el máximo registrado."""
+        if not self.count:
+            return 0
+        target = max(1, math.ceil(self.count * p / 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self._bounds(index)[1], self.max)
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    @property
+    def stdev(self) -> float:
+        if self.count < 2:
+            return 0.0
+        variance = (self.total_sq - self.total ** 2 / self.count) / (self.count - 1)
+        return math.sqrt(max(variance, 0.0))
+
+    def merge(self, other: "LatencyHistogram"):
+        if other.significant_digits != self.significant_digits:
+            raise ValueError("Solo se pueden combinar histogramas con la misma precisión")
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.total_sq += other.total_sq
+        if other.count:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def to_dict(self) -> dict:
+        return {
+            "unit": "us",
+            "significant_digits": self.significant_digits,
+            "count": self.count,
+            "total": self.total,
+            "total_sq": self.total_sq,
+            "min": self.min,
+            "max": self.max,
+            "counts": sorted(self.counts.items()),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "LatencyHistogram":
+        hist = cls(data["significant_digits"])
+        hist.counts = {int(index): count for index, count in data["counts"]}
+        hist.count = data["count"]
+        hist.total = data["total"]
+        hist.total_sq = data["total_sq"]
+        hist.min = data["min"]
+        hist.max = data["max"]
+        return hist
+
+
+def error_category(e: BaseException) -> str:
+    """Clasifica una excepción de red en una categoría corta para contarla."""
+    if isinstance(e, urllib.error.HTTPError):
+        return f"http_{e.code // 100}xx"
+    if isinstance(e, urllib.error.URLError):
+        e = e.reason if isinstance(e.reason, BaseException) else e
+    if isinstance(e, (asyncio.TimeoutError, TimeoutError, socket.timeout)):
+        return "timeout"
+    if isinstance(e, socket.gaierror):
+        return "dns"
+    if isinstance(e, ssl.SSLError):
+        return "tls"
+    if isinstance(e, ConnectionRefusedError):
+        return "connection_refused"
+    if isinstance(e, (ConnectionResetError, BrokenPipeError, asyncio.IncompleteReadError)):
+        return "connection_reset"
+    if isinstance(e, (ConnectionError, OSError)):
+        return "connection_error"
+    return type(e).__name__
+
+
+class BenchmarkStats:
+    """
+    Resultados de un run en memoria constante: histogramas de latencia y
+    contadores de errores por categoría.
+
+    `latency` es la latencia reportada (corregida en modo open-loop) y
+    `service` la medida desde el envío real (solo open-loop). Con
+    `progress_total` se imprime el avance cada 10%.
+
+    Los requests que terminan antes de `measure_from` (`time.time`, fin del
+    warm-up) solo cuentan en `warmup_completed`. Con `windowed` además se
+    acumula una ventana por intervalo que se vacía con `take_window`. Los
+    resultados con `endpoint` se desglosan también en `endpoints`.
+
+    Las fases de cada request exitoso (`phases`, ver `PHASES`) y los gaps
+    entre chunks de las respuestas streaming van a histogramas propios.
+    """
+
+    def __init__(
+        self,
+        significant_digits: int = 2,
+        progress_total: int = None,
+        measure_from: float = None,
+        windowed: bool = False,
+        by_endpoint: bool = True,
+    ):
+        self.latency = LatencyHistogram(significant_digits)
+        self.service = LatencyHistogram(significant_digits)
+        self.errors = {}
+        self.failed = 0
+        self.completed = 0
+        self.warmup_completed = 0
+        self.progress_total = progress_total
+        self.measure_from = measure_from
+        self.windowed = windowed
+        self.window = LatencyHistogram(significant_digits)
+        self.window_failed = 0
+        self.by_endpoint = by_endpoint
+        self.endpoints = {}
+        self.phases = {}
+        self.chunk_gaps = LatencyHistogram(significant_digits)
+        self.streamed = 0
+        self.lock = threading.Lock()
+
+    def record(self, result: dict):
+        with self.lock:
+            if self.by_endpoint and "endpoint" in result:
+                if result["endpoint"] not in self.endpoints:
+                    self.endpoints[result["endpoint"]] = BenchmarkStats(
+                        self.latency.significant_digits, measure_from=self.measure_from, by_endpoint=False
+                    )
+                self.endpoints[result["endpoint"]].record(result)
+            self.completed += 1
+            if self.progress_total:
+                print_progress(self.completed, self.progress_total)
+            if self.windowed:
+                if result["error"] is not None:
+                    self.window_failed += 1
+                else:
+                    self.window.record(result["duration_ms"] * 1000)
+            if self.measure_from is not None and time.time() < self.measure_from:
+                self.warmup_completed += 1
+                return
+            if result["error"] is not None:
+                self.failed += 1
+                self.errors[result["error"]] = self.errors.get(result["error"], 0) + 1
+                return
+            self.latency.record(result["duration_ms"] * 1000)
+            if "service_ms" in result:
+                self.service.record(result["service_ms"] * 1000)
+            for phase, value in result.get("phases", {}).items():
+                if phase not in self.phases:
+                    self.phases[phase] = LatencyHistogram(self.latency.significant_digits)
+                self.phases[phase].record(value * 1000)
+            if "chunk_gaps" in result:
+                self.streamed += 1
+                for gap in result["chunk_gaps"]:
+                    self.chunk_gaps.record(gap * 1000)
+
+    def merge(self, other: "BenchmarkStats"):
+        self.latency.merge(other.latency)
+        self.service.merge(other.service)
+        for category, count in other.errors.items():
+            self.errors[category] = self.errors.get(category, 0) + count
+        self.failed += other.failed
+        self.completed += other.completed
+        self.warmup_completed += other.warmup_completed
+        for phase, hist in other.phases.items():
+            if phase in self.phases:
+                self.phases[phase].merge(hist)
+            else:
+                self.phases[phase] = hist
+        self.chunk_gaps.merge(other.chunk_gaps)
+        self.streamed += other.streamed
+        for name, endpoint in other.endpoints.items():
+            if name in self.endpoints:
+                self.endpoints[name].merge(endpoint)
+            else:
+                self.endpoints[name] = endpoint
+
+    def take_window(self) -> dict:
+        """Devuelve la ventana acumulada desde la llamada anterior (serializada) y la reinicia."""
+        with self.lock:
+            window = {"latency": self.window.to_dict(), "failed": self.window_failed}
+            self.window = LatencyHistogram(self.window.significant_digits)
+            self.window_failed = 0
+        return window
+
+    def to_dict(self) -> dict:
+        return {
+            "latency": self.latency.to_dict(),
+            "service": self.service.to_dict(),
+            "errors": dict(self.errors),
+            "failed": self.failed,
+            "completed": self.completed,
+            "warmup_completed": self.warmup_completed,
+            "phases": {phase: hist.to_dict() for phase, hist in self.phases.items()},
+            "chunk_gaps": self.chunk_gaps.to_dict(),
+            "streamed": self.streamed,
+            "endpoints": {name: endpoint.to_dict() for name, endpoint in self.endpoints.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "BenchmarkStats":
+        stats = cls(data["latency"]["significant_digits"])
+        stats.latency = LatencyHistogram.from_dict(data["latency"])
+        stats.service = LatencyHistogram.from_dict(data["service"])
+        stats.errors = dict(data["errors"])
+        stats.failed = data["failed"]
+        stats.completed = data["completed"]
+        stats.warmup_completed = data.get("warmup_completed", 0)
+        stats.phases = {phase: LatencyHistogram.from_dict(hist) for phase, hist in data.get("phases", {}).items()}
+        if "chunk_gaps" in data:
+            stats.chunk_gaps = LatencyHistogram.from_dict(data["chunk_gaps"])
+        stats.streamed = data.get("streamed", 0)
+        stats.endpoints = {
+            name: cls.from_dict(endpoint) for name, endpoint in data.get("endpoints", {}).items()
+        }
+        for endpoint in stats.endpoints.values():
+            endpoint.by_endpoint = False
+        return stats
+
+
+class TimeSeriesReporter:
+    """
+    Snapshots por intervalo (throughput, errores y percentiles) a stdout y,
+    opcionalmente, a un archivo JSONL o CSV (según la extensión).
+
+    Con varios generadores (`sources`), un intervalo se emite cuando llegó
+    la ventana de todos, combinando sus histogramas.
+    """
+
+    FIELDS = (
+        "t_s", "requests", "rps", "errors", "error_rate", "p50_ms", "p90_ms", "p95_ms", "p99_ms", "max_ms", "warmup"
+    )
+
+    def __init__(self, interval: float, warmup: float = 0.0, sources: int = 1, output: str = None):
+        self.interval = interval
+        self.warmup = warmup
+        self.sources = sources
+        self.pending = {}
+        self.rows = []
+        self.file = None
+        self.writer = None
+        if output:
+            self.file = open(output, "w", newline="")
+            if os.path.splitext(output)[1].lower() == ".csv":
+                self.writer = csv.DictWriter(self.file, fieldnames=self.FIELDS)
+                self.writer.writeheader()
+
+    def add(self, index: int, window: dict):
+        self.pending.setdefault(index, []).append(window)
+        if len(self.pending[index]) == self.sources:
+            self._emit(index)
+
+    def flush(self):
+        """Emite los intervalos incompletos (el último de cada generador)."""
+        for index in sorted(self.pending):
+            self._emit(index)
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+
+    def _emit(self, index: int):
+        windows = self.pending.pop(index)
+        hist = LatencyHistogram.from_dict(windows[0]["latency"])
+        for window in windows[1:]:
+            hist.merge(LatencyHistogram.from_dict(window["latency"]))
+        failed = sum(window["failed"] for window in windows)
+        end = max(window["end"] for window in windows)
+        duration = max(end - min(window["start"] for window in windows), 1e-9)
+        requests = hist.count + failed
+
+        row = {
+            "t_s": round(end, 2),
+            "requests": requests,
+            "rps": round(requests / duration, 1),
+            "errors": failed,
+            "error_rate": round(failed / requests * 100, 2) if requests else 0.0,
+            "p50_ms": round(hist.percentile(50) / 1000, 2),
+            "p90_ms": round(hist.percentile(90) / 1000, 2),
+            "p95_ms": round(hist.percentile(95) / 1000, 2),
+            "p99_ms": round(hist.percentile(99) / 1000, 2),
+            "max_ms": round((hist.max or 0) / 1000, 2),
+            "warmup": end <= self.warmup,
+        }
+        self.rows.append(row)
+        print(
+            f"   [{row['t_s']:>7.1f}s] {row['rps']:>8.1f} req/s | err {row['error_rate']:>5.1f}% | "
+            f"p50 {row['p50_ms']:.1f}ms p90 {row['p90_ms']:.1f}ms p99 {row['p99_ms']:.1f}ms"
+            + (" (warm-up)" if row["warmup"] else "")
+        )
+        if self.writer is not None:
+            self.writer.writerow(row)
+        elif self.file is not None:
+            self.file.write(json.dumps(row) + "\n")
+        if self.file is not None:
+            self.file.flush()
+
+
+def sample_windows(stats: BenchmarkStats, interval: float, start_at: float, sink, stop: threading.Event):
+    """
+    Cada `interval` segundos (alineados a `start_at`) pasa la ventana de
+    `stats` a `sink(index, window)`. Al activarse `stop` envía la ventana
+    parcial final y termina.
+    """
+    index = 0
+    while True:
+        index += 1
+        stopped = stop.wait(max(0.0, start_at + index * interval - time.time()))
+        window = stats.take_window()
+        window["start"] = (index - 1) * interval
+        window["end"] = min(index * interval, time.time() - start_at)
+        sink(index, window)
+        if stopped:
+            return
+
+
+TEMPLATE_VAR = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+ENV_VAR = re.compile(r"\$\{(\w+)\}")
+
+
+class Scenario:
+    """
+    Carga de trabajo con varios endpoints ponderados (ver el docstring del
+    módulo). Cada llamada a `next_request` elige un endpoint según `weight`
+    y resuelve sus templates.
+
+    Variables: `{{nombre}}` toma un valor de `variables` (al azar si es una
+    lista), `{{seq}}` un contador por request y `{{uuid}}` un UUID nuevo;
+    `${VAR}` se reemplaza por la variable de entorno al cargar el archivo.
+    """
+
+    def __init__(self, data: dict, seq_start: int = 0, seq_step: int = 1):
+        data = self._expand_env(data)
+        self.data = data
+        self.name = data.get("name", "scenario")
+        self.base_url = data["base_url"].rstrip("/")
+        self.headers = data.get("headers", {})
+        self.variables = data.get("variables", {})
+        self.think_time = data.get("think_time", 0)
+        self.breakdown = data.get("breakdown", True)
+        self.endpoints = [
+            {
+                "name": endpoint.get("name") or f"{endpoint.get('method', 'GET')} {endpoint['path']}",
+                "method": endpoint.get("method", "GET").upper(),
+                "path": endpoint["path"],
+                "headers": endpoint.get("headers", {}),
+                "json": endpoint.get("json"),
+                "weight": endpoint.get("weight", 1),
+                "think_time": endpoint.get("think_time", self.think_time),
+            }
+            for endpoint in data["endpoints"]
+        ]
+        if not self.endpoints:
+            raise ValueError("El escenario no tiene endpoints")
+        self.weights = [endpoint["weight"] for endpoint in self.endpoints]
+        self.seq = seq_start
+        self.seq_step = seq_step
+        self.random = random.Random()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str) -> "Scenario":
+        """Carga un escenario desde YAML (requiere PyYAML) o JSON."""
+        with open(path) as f:
+            text = f.read()
+        if os.path.splitext(path)[1].lower() == ".json":
+            return cls(json.loads(text))
+        try:
+            import yaml
+        except ImportError:
+            sys.exit("❌ Los escenarios YAML requieren PyYAML (pip install pyyaml); o usá un archivo .json")
+        return cls(yaml.safe_load(text))
+
+    @classmethod
+    def single(cls, url: str, method: str = "GET") -> "Scenario":
+        """Escenario de un solo endpoint (modo --url)."""
+        parts = urllib.parse.urlsplit(url)
+        path = urllib.parse.urlunsplit(("", "", parts.path or "/", parts.query, ""))
+        return cls({
+            "name": url,
+            "base_url": urllib.parse.urlunsplit((parts.scheme, parts.netloc, "", "", "")),
+            "endpoints": [{"name": f"{method.upper()} {path}", "method": method, "path": path}],
+            "breakdown": False,
+        })
+
+    def next_request(self) -> dict:
+        """Elige el próximo endpoint y devuelve el request ya resuelto."""
+        with self.lock:
+            endpoint = self.random.choices(self.endpoints, self.weights)[0]
+            self.seq += self.seq_step
+            values = {"seq": self.seq, "uuid": None}
+            for name, value in self.variables.items():
+                values[name] = self.random.choice(value) if isinstance(value, list) else value
+
+        headers = {
+            name: str(self._render(value, values))
+            for name, value in {**self.headers, **endpoint["headers"]}.items()
+        }
+        body = None
+        if endpoint["json"] is not None:
+            body = json.dumps(self._render(endpoint["json"], values)).encode()
+            headers.setdefault("Content-Type", "application/json")
+
+        think_time = endpoint["think_time"]
+        if isinstance(think_time, list):
+            think_time = self.random.uniform(*think_time)
+
+        path = str(self._render(endpoint["path"], values))
+        return {
+            "endpoint": endpoint["name"],
+            "method": endpoint["method"],
+            "url": self.base_url + path,
+            "path": path,
+            "headers": headers,
+            "body": body,
+            "think_time": think_time,
+        }
+
+    def _render(self, value, values: dict):
+        """Resuelve `{{var}}` en strings, listas y dicts; un template solo conserva el tipo."""
+        if isinstance(value, dict):
+            return {key: self._render(item, values) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self._render(item, values) for item in value]
+        if not isinstance(value, str):
+            return value
+
+        def resolve(name):
+            if name == "uuid":
+                return str(uuid.uuid4())
+            if name not in values:
+                raise KeyError(f"Variable de escenario no definida: {name}")
+            return values[name]
+
+        whole = TEMPLATE_VAR.fullmatch(value)
+        if whole:
+            return resolve(whole.group(1))
+        return TEMPLATE_VAR.sub(lambda match: str(resolve(match.group(1))), value)
+
+    @classmethod
+    def _expand_env(cls, value):
+        if isinstance(value, dict):
+            return {key: cls._expand_env(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [cls._expand_env(item) for item in value]
+        if isinstance(value, str):
+            return ENV_VAR.sub(lambda match: os.environ.get(match.group(1), ""), value)
+        return value
+
+
+PHASES = ("dns", "connect", "tls", "ttfb", "first_chunk", "transfer")
+
+
+class PhaseTimer:
+    """
+    Tiempos (ms) de las fases de un request:
+
+    - `dns`, `connect`, `tls`: solo cuando el request abre la conexión.
+    - `ttfb`: desde el inicio (incluida la conexión) hasta el primer byte de la respuesta.
+    - `first_chunk`: desde el inicio hasta el primer chunk del body (solo streaming).
+    - `transfer`: desde el primer byte hasta el final del body.
+
+    En las respuestas streaming (chunked o hasta el cierre de la conexión)
+    `chunk_gaps` guarda el tiempo entre chunks consecutivos.
+    """
+
+    def __init__(self):
+        self.start = self.last = time.perf_counter()
+        self.phases = {}
+        self.chunk_gaps = None
+        self.first_byte = None
+        self.last_chunk = None
+
+    def mark(self, phase: str):
+        """Cierra `phase` (duración desde la marca anterior)."""
+        now = time.perf_counter()
+        self.phases[phase] = round((now - self.last) * 1000, 3)
+        self.last = now
+
+    def response_started(self):
+        self.first_byte = time.perf_counter()
+        self.phases["ttfb"] = round((self.first_byte - self.start) * 1000, 3)
+
+    def chunk(self):
+        now = time.perf_counter()
+        if self.chunk_gaps is None:
+            self.chunk_gaps = []
+            self.phases["first_chunk"] = round((now - self.start) * 1000, 3)
+        else:
+            self.chunk_gaps.append(round((now - self.last_chunk) * 1000, 3))
+        self.last_chunk = now
+
+    def finish(self, result: dict) -> dict:
+        """Agrega `phases` (y `chunk_gaps` si hubo streaming) a `result`."""
+        if self.first_byte is not None:
+            self.phases["transfer"] = round((time.perf_counter() - self.first_byte) * 1000, 3)
+        result["phases"] = self.phases
+        if self.chunk_gaps is not None:
+            result["chunk_gaps"] = self.chunk_gaps
+        return result
+
+
+# Redirecciones que sigue `single_request`, como el HTTPRedirectHandler de urllib
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 10
+
+
+def proxy_for(parts: urllib.parse.SplitResult):
+    """Proxy de HTTP_PROXY/HTTPS_PROXY para la URL (None si no hay o NO_PROXY la excluye)."""
+    proxy = urllib.request.getproxies().get(parts.scheme)
+    if not proxy or urllib.request.proxy_bypass(parts.hostname or ""):
+        return None
+    return urllib.parse.urlsplit(proxy if "://" in proxy else f"http://{proxy}")
+
+
+def open_tunnel(sock: socket.socket, host: str, port: int, headers: dict):
+    """Abre un túnel CONNECT hacia host:port a través del proxy conectado en `sock`."""
+    authority = f"[{host}]:{port}" if ":" in host else f"{host}:{port}"
+    lines = [f"CONNECT {authority} HTTP/1.1", f"Host: {authority}"]
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    sock.sendall(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+    resp = http.client.HTTPResponse(sock, method="CONNECT")
+    resp.begin()
+    if resp.status != 200:
+        raise OSError(f"Tunnel connection failed: {resp.status} {resp.reason}")
+
+
+def open_request(url: str, method: str, timeout: int, headers: dict, body: bytes, timer: "PhaseTimer") -> tuple:
+    """Envía un request en una conexión nueva (directa o vía proxy). Retorna (conn, resp)."""
+    parts = urllib.parse.urlsplit(url)
+    host = parts.hostname or "localhost"
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    path = urllib.parse.urlunsplit(("", "", parts.path or "/", parts.query, ""))
+    headers = {"User-Agent": "lmagent-profiler", **headers}
+    proxy = proxy_for(parts)
+    proxy_headers = {}
+    if proxy is not None and proxy.username:
+        credentials = f"{urllib.parse.unquote(proxy.username)}:{urllib.parse.unquote(proxy.password or '')}"
+        proxy_headers["Proxy-Authorization"] = "Basic " + base64.b64encode(credentials.encode()).decode()
+
+    conn = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        target = (proxy.hostname, proxy.port or 80) if proxy is not None else (host, port)
+        family, socktype, proto, _, address = socket.getaddrinfo(*target, type=socket.SOCK_STREAM)[0]
+        timer.mark("dns")
+        conn.sock = socket.socket(family, socktype, proto)
+        conn.sock.settimeout(timeout)
+        conn.sock.connect(address)
+        timer.mark("connect")
+        if parts.scheme == "https":
+            if proxy is not None:
+                open_tunnel(conn.sock, host, port, proxy_headers)
+            conn.sock = ssl.create_default_context().wrap_socket(conn.sock, server_hostname=host)
+            timer.mark("tls")
+        elif proxy is not None:
+            # A un proxy HTTP se le pide la URL absoluta
+            path = urllib.parse.urlunsplit((parts.scheme, parts.netloc, parts.path or "/", parts.query, ""))
+            headers.update(proxy_headers)
+
+        conn.request(method, path, body=body, headers=headers)
+        resp = conn.getresponse()
+        timer.response_started()
+        return conn, resp
+    except BaseException:
+        conn.close()
+        raise
+
+
+def single_request(
+    url: str, method: str = "GET", timeout: int = 30, headers: dict = None, body: bytes = None
+) -> dict:
+    """
+    Ejecuta un request en una conexión nueva y mide tiempo de respuesta y fases (ver `PhaseTimer`).
+
+    Como urllib, usa el proxy de HTTP_PROXY/HTTPS_PROXY (respetando NO_PROXY) y
+    sigue las redirecciones: `duration_ms` cubre toda la cadena y las fases
+    son las del último request.
+    """
     start = time.perf_counter()
+    headers = dict(headers or {})
+    conn = None
     try:
-        req = urllib.request.Request(url, method=method)
-        with urllib.request.urlopen(req, timeout=timeout) as resp:
-            body = resp.read()
-            elapsed = (time.perf_counter() - start) * 1000  # ms
-            return {
-                "status": resp.status,
-                "duration_ms": round(elapsed, 2),
-                "size_bytes": len(body),
-                "error": None,
-            }
+        for redirects in range(MAX_REDIRECTS + 1):
+            timer = PhaseTimer()
+            conn, resp = open_request(url, method, timeout, headers, body, timer)
+            location = resp.getheader("Location")
+            follow = method in ("GET", "HEAD") or (method == "POST" and resp.status in (301, 302, 303))
+            if resp.status not in REDIRECT_CODES or not location or not follow:
+                break
+            if redirects == MAX_REDIRECTS:
+                raise urllib.error.HTTPError(url, resp.status, "Demasiadas redirecciones", resp.headers, None)
+            resp.read()
+            conn.close()
+            url = urllib.parse.urljoin(url, location)
+            if method == "POST":
+                # Igual que urllib: el POST redirigido pasa a GET sin body
+                method, body = "GET", None
+                headers = {
+                    name: value for name, value in headers.items()
+                    if name.lower() not in ("content-type", "content-length")
+                }
+
+        if resp.chunked or resp.length is None:
+            size = 0
+            while True:
+                chunk = resp.read1(2 ** 16)
+                if not chunk:
+                    break
+                timer.chunk()
+                size += len(chunk)
+        else:
+            size = len(resp.read())
+        elapsed = (time.perf_counter() - start) * 1000  # ms
+        return timer.finish({
+            "status": resp.status,
+            "duration_ms": round(elapsed, 2),
+            "size_bytes": size,
+            "error": None if resp.status < 400 else f"http_{resp.status // 100}xx",
+        })
     except Exception as e:
         elapsed = (time.perf_counter() - start) * 1000
         return {
             "status": 0,
             "duration_ms": round(elapsed, 2),
             "size_bytes": 0,
-            "error": str(e),
+            "error": error_category(e),
         }
+    finally:
+        if conn is not None:
+            conn.close()
 
 
-def run_benchmark(url: str, num_requests: int, concurrency: int, method: str) -> dict:
-    """Ejecuta benchmark de un endpoint."""
-    print(f"\n🏎️  Benchmarking: {method} {url}")
-    print(f"   Requests: {num_requests} | Concurrency: {concurrency}")
-    print(f"   Started: {datetime.now().isoformat()}")
-    print("-" * 50)
+# Métodos que pueden reenviarse sin efectos extra (RFC 9110, 9.2.2)
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "TRACE", "PUT", "DELETE"})
 
-    results = []
-    start_total = time.perf_counter()
 
-    with ThreadPoolExecutor(max_workers=concurrency) as executor:
-        futures = [
-            executor.submit(single_request, url, method)
-            for _ in range(num_requests)
-        ]
-        for i, future in enumerate(futures):
-            result = future.result()
-            results.append(result)
-            # Progress indicator
-            if (i + 1) % max(1, num_requests // 10) == 0:
-                pct = (i + 1) / num_requests * 100
-                print(f"   Progress: {pct:.0f}% ({i + 1}/{num_requests})")
+class AsyncHTTPConnection:
+    """
+    Conexión HTTP/1.1 persistente (keep-alive) sobre asyncio.
+
+    Un request a la vez por conexión (sin pipelining); si el servidor cerró
+    la conexión inactiva, los métodos idempotentes se reenvían por una nueva.
+    Las fases de cada request se miden con
+    un `PhaseTimer`.
+    """
+
+    def __init__(self, url: str):
+        parts = urllib.parse.urlsplit(url)
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.ssl = ssl.create_default_context() if parts.scheme == "https" else None
+        self.path = urllib.parse.urlunsplit(("", "", parts.path or "/", parts.query, "")) or "/"
+        default_port = 443 if parts.scheme == "https" else 80
+        self.host_header = self.host if self.port == default_port else f"{self.host}:{self.port}"
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method: str, path: str = None, headers: dict = None, body: bytes = None) -> tuple:
+        """Envía un request y lee la respuesta completa. Retorna (status, body, timer)."""
+        timer = PhaseTimer()
+        reused = self.writer is not None
+        if not reused:
+            await self._connect(timer)
+        try:
+            return await self._roundtrip(method, path or self.path, headers or {}, body or b"", timer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self.close()
+            # Solo se reintenta si el servidor cerró la conexión inactiva antes
+            # de responder y el método es idempotente: si llegó parte de la
+            # respuesta, o el request no puede repetirse, se registra el error
+            if not reused or timer.first_byte is not None or method.upper() not in IDEMPOTENT_METHODS:
+                raise
+            timer = PhaseTimer()
+            await self._connect(timer)
+            return await self._roundtrip(method, path or self.path, headers or {}, body or b"", timer)
+        except BaseException:
+            self.close()
+            raise
+
+    async def _connect(self, timer: PhaseTimer):
+        loop = asyncio.get_running_loop()
+        family, socktype, proto, _, address = (
+            await loop.getaddrinfo(self.host, self.port, type=socket.SOCK_STREAM)
+        )[0]
+        timer.mark("dns")
+        sock = socket.socket(family, socktype, proto)
+        sock.setblocking(False)
+        try:
+            await loop.sock_connect(sock, address)
+            timer.mark("connect")
+            self.reader, self.writer = await asyncio.open_connection(
+                sock=sock, ssl=self.ssl, server_hostname=self.host if self.ssl else None, limit=2 ** 20
+            )
+        except BaseException:
+            sock.close()
+            raise
+        if self.ssl:
+            timer.mark("tls")
+
+    async def aclose(self):
+        self.close()
+
+    async def _roundtrip(self, method: str, path: str, headers: dict, body: bytes, timer: PhaseTimer) -> tuple:
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host_header}"]
+        headers = {"User-Agent": "lmagent-profiler", "Accept": "*/*", **headers}
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        lines.append(f"Content-Length: {len(body)}")
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("Conexión cerrada por el servidor")
+        timer.response_started()
+        version, status, *_ = status_line.decode("latin-1").split(" ", 2)
+        status = int(status)
+
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+        if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+            body = b""
+        elif "chunked" in headers.get("transfer-encoding", "").lower():
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    # Trailers hasta la línea vacía
+                    while (await self.reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                timer.chunk()
+                await self.reader.readexactly(2)
+            body = b"".join(chunks)
+        elif "content-length" in headers:
+            body = await self.reader.readexactly(int(headers["content-length"]))
+        else:
+            # Body hasta el cierre de la conexión (streaming sin chunked)
+            chunks = []
+            while True:
+                chunk = await self.reader.read(2 ** 16)
+                if not chunk:
+                    break
+                timer.chunk()
+                chunks.append(chunk)
+            body = b"".join(chunks)
+            keep_alive = False
+
+        if not keep_alive:
+            self.close()
+        return status, body, timer
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class HTTP2Connection:
+    """
+    Conexión HTTP/2 (vía httpx, dependencia opcional) compartida por todos
+    los workers del event loop: cada request es un stream multiplexado.
+
+    Con http:// usa h2c con prior knowledge; con https:// negocia h2 por
+    ALPN y falla si el servidor no lo soporta (no cae a HTTP/1.1). httpx no
+    separa la resolución DNS del connect, así que `connect` la incluye.
+    """
+
+    def __init__(self, url: str, max_connections: int = 1):
+        try:
+            import h2  # noqa: F401  (httpx lo necesita para http2=True)
+            import httpx
+        except ImportError:
+            sys.exit('❌ El engine http2 requiere httpx con HTTP/2 (pip install "httpx[http2]")')
+        self.client = httpx.AsyncClient(
+            base_url=url,
+            http1=False,
+            http2=True,
+            timeout=None,
+            limits=httpx.Limits(max_connections=max_connections),
+        )
+        self.path = urllib.parse.urlsplit(url).path or "/"
+
+    async def request(self, method: str, path: str = None, headers: dict = None, body: bytes = None) -> tuple:
+        timer = PhaseTimer()
+        started = {}
+
+        async def trace(event: str, info: dict):
+            # connection.connect_tcp / connection.start_tls solo al abrir la conexión
+            name, _, stage = event.rpartition(".")
+            if stage == "started":
+                started[name] = time.perf_counter()
+            elif stage == "complete" and name in ("connection.connect_tcp", "connection.start_tls"):
+                phase = "connect" if name.endswith("tcp") else "tls"
+                timer.phases[phase] = round((time.perf_counter() - started[name]) * 1000, 3)
+
+        request = self.client.build_request(
+            method,
+            path or self.path,
+            headers={"User-Agent": "lmagent-profiler", **(headers or {})},
+            content=body,
+            extensions={"trace": trace},
+        )
+        resp = await self.client.send(request, stream=True)
+        try:
+            timer.response_started()
+            streaming = "content-length" not in resp.headers
+            chunks = []
+            async for chunk in resp.aiter_raw():
+                if streaming:
+                    timer.chunk()
+                chunks.append(chunk)
+        finally:
+            await resp.aclose()
+        return resp.status_code, b"".join(chunks), timer
+
+    def close(self):
+        pass
+
+    async def aclose(self):
+        await self.client.aclose()
 
-    total_time = time.perf_counter() - start_total
 
-    # Calcular métricas
-    durations = [r["duration_ms"] for r in results if r["error"] is None]
-    errors = [r for r in results if r["error"] is not None]
+def open_connections(scenario: Scenario, engine: str, count: int) -> list:
+    """`count` conexiones keep-alive propias (engine async) o una conexión HTTP/2 compartida (engine http2)."""
+    if engine == "http2":
+        return [HTTP2Connection(scenario.base_url)] * count
+    return [AsyncHTTPConnection(scenario.base_url) for _ in range(count)]
 
-    if not durations:
-        return {"error": "Todos los requests fallaron", "errors": len(errors)}
 
-    durations_sorted = sorted(durations)
+async def close_connections(conns: list):
+    for conn in set(conns):
+        await conn.aclose()
+
+
+async def async_single_request(conn: AsyncHTTPConnection, request: dict, timeout: int = 30) -> dict:
+    """Ejecuta un request (de `Scenario.next_request`) sobre una conexión persistente y mide tiempo de respuesta y fases."""
+    start = time.perf_counter()
+    try:
+        status, body, timer = await asyncio.wait_for(
+            conn.request(request["method"], request["path"], request["headers"], request["body"]), timeout
+        )
+        elapsed = (time.perf_counter() - start) * 1000  # ms
+        return timer.finish({
+            "status": status,
+            "duration_ms": round(elapsed, 2),
+            "size_bytes": len(body),
+            "error": None if status < 400 else f"http_{status // 100}xx",
+        })
+    except Exception as e:
+        elapsed = (time.perf_counter() - start) * 1000
+        return {
+            "status": 0,
+            "duration_ms": round(elapsed, 2),
+            "size_bytes": 0,
+            "error": error_category(e),
+        }
+
+
+def print_progress(done: int, num_requests: int):
+    """Imprime el avance cada 10% de los requests."""
+    if done % max(1, num_requests // 10) == 0:
+        pct = done / num_requests * 100
+        print(f"   Progress: {pct:.0f}% ({done}/{num_requests})")
+
+
+def run_threaded(scenario: Scenario, num_requests: int, concurrency: int, stats: BenchmarkStats):
+    """Engine "thread": un thread por request en vuelo, conexión nueva por request."""
+    remaining = [num_requests]
+
+    def worker():
+        while True:
+            with stats.lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            request = scenario.next_request()
+            result = single_request(request["url"], request["method"], headers=request["headers"], body=request["body"])
+            result["endpoint"] = request["endpoint"]
+            stats.record(result)
+            if request["think_time"]:
+                time.sleep(request["think_time"])
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(min(concurrency, num_requests))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+async def run_async(
+    scenario: Scenario, num_requests: int, concurrency: int, stats: BenchmarkStats, engine: str = "async"
+):
+    """
+    Engine "async": `concurrency` workers en un solo event loop, cada uno con
+    su propia conexión keep-alive reutilizada entre requests. Con el engine
+    "http2" los workers comparten una conexión HTTP/2 (un stream cada uno).
+    """
+    remaining = num_requests
+
+    async def worker(conn):
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            request = scenario.next_request()
+            result = await async_single_request(conn, request)
+            result["endpoint"] = request["endpoint"]
+            stats.record(result)
+            if request["think_time"]:
+                await asyncio.sleep(request["think_time"])
+
+    conns = open_connections(scenario, engine, min(concurrency, num_requests))
+    try:
+        await asyncio.gather(*(worker(conn) for conn in conns))
+    finally:
+        await close_connections(conns)
+
+
+async def run_open_loop(
+    scenario: Scenario,
+    num_requests: int,
+    concurrency: int,
+    rate: float,
+    stats: BenchmarkStats,
+    offset: float = 0.0,
+    start: float = None,
+    engine: str = "async",
+):
+    """
+    Modo open-loop: los requests salen a tasa constante (`rate` por segundo)
+    según un timeline fijo (desde `start` + `offset`, en `time.perf_counter`),
+    aunque el servidor se demore en responder.
+
+    Evita la omisión coordinada: `duration_ms` se mide desde el momento en
+    que el request debía salir (corregida) y `service_ms` desde que salió
+    realmente (sin corregir). Si las `concurrency` conexiones están ocupadas,
+    el request espera una libre y esa espera cuenta en la latencia corregida
+    (con el engine "http2", `concurrency` es el máximo de streams en vuelo).
+    Los think times del escenario no aplican: la tasa define las llegadas.
+    """
+    pool = asyncio.Queue()
+    conns = open_connections(scenario, engine, concurrency)
+    for conn in conns:
+        pool.put_nowait(conn)
+
+    async def fire(intended: float):
+        request = scenario.next_request()
+        conn = await pool.get()
+        try:
+            result = await async_single_request(conn, request)
+        finally:
+            pool.put_nowait(conn)
+        result["endpoint"] = request["endpoint"]
+        result["service_ms"] = result["duration_ms"]
+        result["duration_ms"] = round((time.perf_counter() - intended) * 1000, 2)
+        stats.record(result)
+
+    # Solo se retienen los requests en vuelo
+    in_flight = set()
+    start = time.perf_counter() if start is None else start
+    try:
+        for i in range(num_requests):
+            intended = start + offset + i / rate
+            delay = intended - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            task = asyncio.create_task(fire(intended))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        await asyncio.gather(*in_flight)
+    finally:
+        await close_connections(conns)
+
+
+def parse_duration(value: str) -> float:
+    """Parsea una duración: "30", "30s", "500ms", "2m" o "1h" → segundos."""
+    text = value.strip().lower()
+    for suffix, factor in (("ms", 0.001), ("s", 1), ("m", 60), ("h", 3600)):
+        if text.endswith(suffix):
+            text, scale = text[: -len(suffix)], factor
+            break
+    else:
+        scale = 1
+    try:
+        seconds = float(text) * scale
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Duración inválida: {value!r} (ej. 30s, 500ms, 2m)")
+    if seconds < 0:
+        raise argparse.ArgumentTypeError(f"La duración no puede ser negativa: {value!r}")
+    return seconds
+
+
+def parse_rate(value: str) -> float:
+    """Parsea una tasa de arrival: "100", "100/s" o "6000/m" → requests por segundo."""
+    number, _, unit = value.partition("/")
+    per = {"": 1, "s": 1, "m": 60, "min": 60, "h": 3600}.get(unit.strip().lower())
+    try:
+        rate = float(number) / per
+    except (TypeError, ValueError):
+        raise argparse.ArgumentTypeError(f"Tasa inválida: {value!r} (ej. 100/s, 6000/m)")
+    if rate <= 0:
+        raise argparse.ArgumentTypeError(f"La tasa debe ser positiva: {value!r}")
+    return rate
+
+
+def latency_stats(hist: LatencyHistogram) -> dict:
+    """Min, max, media, mediana, desvío y percentiles (ms) de un histograma en µs."""
+    return {
+        "min_ms": round(hist.min / 1000, 2),
+        "max_ms": round(hist.max / 1000, 2),
+        "mean_ms": round(hist.mean / 1000, 2),
+        "median_ms": round(hist.percentile(50) / 1000, 2),
+        "stdev_ms": round(hist.stdev / 1000, 2),
+        "p90_ms": round(hist.percentile(90) / 1000, 2),
+        "p95_ms": round(hist.percentile(95) / 1000, 2),
+        "p99_ms": round(hist.percentile(99) / 1000, 2),
+        "p999_ms": round(hist.percentile(99.9) / 1000, 2),
+    }
+
+
+ENGINES = ("thread", "async", "http2")
+
+
+def run_engine(
+    scenario: Scenario,
+    num_requests: int,
+    concurrency: int,
+    engine: str,
+    rate: float,
+    stats: BenchmarkStats,
+    offset: float = 0.0,
+):
+    """Corre el engine elegido (o el modo open-loop si hay `rate`) registrando en `stats`."""
+    if rate:
+        asyncio.run(run_open_loop(scenario, num_requests, concurrency, rate, stats, offset, engine=engine))
+    elif engine in ("async", "http2"):
+        asyncio.run(run_async(scenario, num_requests, concurrency, stats, engine))
+    else:
+        run_threaded(scenario, num_requests, concurrency, stats)
+
+
+_window_queue = None
+
+
+def init_worker(window_queue):
+    """Initializer del pool: cola por la que los workers envían sus ventanas."""
+    global _window_queue
+    _window_queue = window_queue
+
+
+def run_worker(task: dict) -> tuple:
+    """
+    Proceso generador de carga de `--workers`: espera el inicio común
+    (`start_at`, reloj de pared), corre su parte y devuelve sus stats serializadas.
+    Si hay `interval`, envía una ventana por intervalo y al final `(None, index)`.
+    """
+    start_at = task["start_at"]
+    # Secuencias intercaladas entre workers para que {{seq}} no se repita
+    scenario = Scenario(task["scenario"], seq_start=task["index"], seq_step=task["workers"])
+    stats = BenchmarkStats(
+        task["significant_digits"],
+        measure_from=start_at + task["warmup"],
+        windowed=bool(task["interval"]),
+        by_endpoint=scenario.breakdown,
+    )
+    time.sleep(max(0.0, start_at - time.time()))
+
+    sampler = None
+    stop = threading.Event()
+    if task["interval"]:
+        sampler = threading.Thread(
+            target=sample_windows,
+            args=(stats, task["interval"], start_at, lambda i, w: _window_queue.put((i, w)), stop),
+            daemon=True,
+        )
+        sampler.start()
+    try:
+        run_engine(
+            scenario, task["num_requests"], task["concurrency"],
+            task["engine"], task["rate"], stats, task["offset"],
+        )
+    finally:
+        if sampler is not None:
+            stop.set()
+            sampler.join()
+            _window_queue.put((None, task["index"]))
+    return task["index"], stats.to_dict()
+
+
+def run_workers(
+    scenario: Scenario,
+    num_requests: int,
+    concurrency: int,
+    engine: str,
+    rate: float,
+    stats: BenchmarkStats,
+    workers: int,
+    warmup: float = 0.0,
+    reporter: TimeSeriesReporter = None,
+) -> float:
+    """
+    Reparte el run entre `workers` procesos y combina sus histogramas en `stats`.
+    Retorna el instante de inicio coordinado (`time.time`).
+
+    Requests, conexiones y tasa se dividen en partes iguales; todos arrancan
+    al mismo instante y en open-loop cada worker desfasa su timeline para
+    que las llegadas combinadas sigan espaciadas de forma uniforme. Las
+    ventanas por intervalo de los workers se combinan en `reporter`.
+    """
+    workers = min(workers, num_requests)
+    start_at = time.time() + 0.5 + 0.1 * workers  # Margen para levantar los procesos
+    tasks = [
+        {
+            "index": index,
+            "workers": workers,
+            "scenario": scenario.data,
+            "num_requests": num_requests // workers + (1 if index < num_requests % workers else 0),
+            "concurrency": max(1, math.ceil(concurrency / workers)),
+            "engine": engine,
+            "rate": rate / workers if rate else None,
+            "significant_digits": stats.latency.significant_digits,
+            "start_at": start_at,
+            "offset": index / rate if rate else 0.0,
+            "warmup": warmup,
+            "interval": reporter.interval if reporter else None,
+        }
+        for index in range(workers)
+    ]
+
+    window_queue = multiprocessing.Queue()
+    collector = None
+    if reporter is not None:
+        def collect():
+            done = 0
+            while done < workers:
+                index, window = window_queue.get()
+                if index is None:
+                    done += 1
+                else:
+                    reporter.add(index, window)
+
+        collector = threading.Thread(target=collect, daemon=True)
+        collector.start()
+
+    with multiprocessing.Pool(workers, initializer=init_worker, initargs=(window_queue,)) as pool:
+        for index, data in pool.imap_unordered(run_worker, tasks):
+            worker_stats = BenchmarkStats.from_dict(data)
+            stats.merge(worker_stats)
+            if reporter is None:
+                print(f"   Worker {index + 1}/{workers}: {worker_stats.completed} requests ({stats.completed}/{num_requests})")
+
+    if collector is not None:
+        collector.join()
+    return start_at
+
+
+def run_benchmark(
+    url: str,
+    num_requests: int,
+    concurrency: int,
+    method: str,
+    engine: str = "thread",
+    rate: float = None,
+    significant_digits: int = 2,
+    workers: int = 1,
+    interval: float = None,
+    warmup: float = 0.0,
+    timeseries: str = None,
+    scenario: Scenario = None,
+) -> dict:
+    """
+    Ejecuta benchmark de un endpoint.
+
+    Con `rate` corre en modo open-loop (engine async): `latency` es la
+    latencia corregida, medida desde el momento programado de cada request,
+    y `latency_uncorrected` la medida desde el envío real.
+
+    Las latencias se registran en histogramas HDR (memoria constante); el
+    dict incluye `histograms` serializados para comparar runs después. Con
+    `workers` > 1 la carga se genera desde varios procesos (ver `run_workers`).
+
+    Con `interval` se imprime un snapshot por intervalo (y se guarda en
+    `timeseries`, JSONL o CSV) en lugar del progreso. Los requests que
+    terminan durante los primeros `warmup` segundos quedan fuera de las
+    métricas finales.
+
+    Con `scenario` se ignoran `url` y `method`: cada request sale de un
+    endpoint ponderado del escenario y el dict incluye `endpoints` con el
+    desglose por endpoint.
+    """
+    if scenario is None:
+        scenario = Scenario.single(url, method)
+        print(f"\n🏎️  Benchmarking: {method} {url}")
+    else:
+        url, method = scenario.base_url, "MIXED"
+        print(f"\n🏎️  Benchmarking: escenario {scenario.name} ({scenario.base_url})")
+        for endpoint in scenario.endpoints:
+            print(f"   - {endpoint['name']}: {endpoint['method']} {endpoint['path']} (peso {endpoint['weight']})")
+    print(f"   Requests: {num_requests} | Concurrency: {concurrency} | Engine: {engine}")
+    if workers > 1:
+        print(f"   Workers: {workers} procesos")
+    if rate:
+        print(f"   Open-loop: {rate:g} req/s")
+    if warmup:
+        print(f"   Warm-up: {warmup:g}s (excluido de las métricas)")
+    print(f"   Started: {datetime.now().isoformat()}")
+    print("-" * 50)
+
+    reporter = None
+    if interval:
+        reporter = TimeSeriesReporter(interval, warmup, sources=min(workers, num_requests), output=timeseries)
+
+    try:
+        if workers > 1:
+            stats = BenchmarkStats(significant_digits, by_endpoint=scenario.breakdown)
+            # El tiempo corre desde el inicio coordinado, no desde el arranque de los procesos
+            start_at = run_workers(
+                scenario, num_requests, concurrency, engine, rate, stats, workers, warmup, reporter
+            )
+        else:
+            start_at = time.time()
+            stats = BenchmarkStats(
+                significant_digits,
+                progress_total=None if reporter else num_requests,
+                measure_from=start_at + warmup,
+                windowed=reporter is not None,
+                by_endpoint=scenario.breakdown,
+            )
+            sampler = None
+            stop = threading.Event()
+            if reporter is not None:
+                sampler = threading.Thread(
+                    target=sample_windows, args=(stats, interval, start_at, reporter.add, stop), daemon=True
+                )
+                sampler.start()
+            try:
+                run_engine(scenario, num_requests, concurrency, engine, rate, stats)
+            finally:
+                if sampler is not None:
+                    stop.set()
+                    sampler.join()
+        total_time = time.time() - start_at
+    finally:
+        if reporter is not None:
+            reporter.close()
+
+    # Calcular métricas (sin el warm-up)
+    measured = stats.completed - stats.warmup_completed
+    measured_time = total_time - min(warmup, total_time)
+    if not stats.latency.count:
+        return {"error": "Todos los requests fallaron", "errors": stats.failed, "error_types": stats.errors}
 
     metrics = {
         "url": url,
         "method": method,
         "total_requests": num_requests,
-        "successful": len(durations),
-        "failed": len(errors),
-        "error_rate": round(len(errors) / num_requests * 100, 2),
+        "successful": stats.latency.count,
+        "failed": stats.failed,
+        "error_rate": round(stats.failed / measured * 100, 2),
+        "error_types": stats.errors,
         "total_time_s": round(total_time, 2),
-        "rps": round(num_requests / total_time, 1),
-        "latency": {
-            "min_ms": round(min(durations), 2),
-            "max_ms": round(max(durations), 2),
-            "mean_ms": round(statistics.mean(durations), 2),
-            "median_ms": round(statistics.median(durations), 2),
-            "stdev_ms": round(statistics.stdev(durations), 2) if len(durations) > 1 else 0,
-            "p90_ms": round(durations_sorted[int(len(durations_sorted) * 0.90)], 2),
-            "p95_ms": round(durations_sorted[int(len(durations_sorted) * 0.95)], 2),
-            "p99_ms": round(durations_sorted[int(len(durations_sorted) * 0.99)], 2),
-        },
+        "rps": round(measured / measured_time, 1) if measured_time > 0 else 0.0,
+        "latency": latency_stats(stats.latency),
     }
 
+    if scenario.breakdown:
+        metrics["scenario"] = scenario.name
+        metrics["endpoints"] = {}
+        for endpoint in scenario.endpoints:
+            endpoint_stats = stats.endpoints.get(endpoint["name"])
+            if endpoint_stats is None:
+                continue
+            measured_endpoint = endpoint_stats.completed - endpoint_stats.warmup_completed
+            metrics["endpoints"][endpoint["name"]] = {
+                "method": endpoint["method"],
+                "path": endpoint["path"],
+                "requests": measured_endpoint,
+                "successful": endpoint_stats.latency.count,
+                "failed": endpoint_stats.failed,
+                "error_rate": round(endpoint_stats.failed / measured_endpoint * 100, 2) if measured_endpoint else 0.0,
+                "error_types": endpoint_stats.errors,
+                "latency": latency_stats(endpoint_stats.latency) if endpoint_stats.latency.count else None,
+            }
+
+    if warmup:
+        metrics["warmup_s"] = warmup
+        metrics["warmup_requests"] = stats.warmup_completed
+
+    if workers > 1:
+        metrics["workers"] = workers
+
+    if reporter is not None:
+        metrics["intervals"] = reporter.rows
+
+    if rate:
+        metrics["target_rps"] = round(rate, 1)
+        metrics["latency_uncorrected"] = latency_stats(stats.service)
+
+    metrics["phases"] = {
+        phase: {"count": stats.phases[phase].count, **latency_stats(stats.phases[phase])}
+        for phase in PHASES
+        if phase in stats.phases
+    }
+    if stats.streamed:
+        metrics["streaming"] = {
+            "responses": stats.streamed,
+            "chunks_per_response": round((stats.chunk_gaps.count + stats.streamed) / stats.streamed, 1),
+            "chunk_gap": latency_stats(stats.chunk_gaps) if stats.chunk_gaps.count else None,
+        }
+
+    metrics["histograms"] = stats.to_dict()
     return metrics
 
 
+def server_profiling(base_url: str, action: str, method: str = "POST") -> bytes:
+    """Llama a los endpoints /_profiling del backend (ver app/core/profiling.py del template)."""
+    headers = {}
+    if os.environ.get("PROFILING_TOKEN"):
+        headers["X-Profiling-Token"] = os.environ["PROFILING_TOKEN"]
+    req = urllib.request.Request(f"{base_url}/_profiling/{action}", headers=headers, method=method)
+    with urllib.request.urlopen(req, timeout=30) as resp:
+        return resp.read()
+
+
+def mann_whitney_p(a: list, b: list) -> float:
+    """
+    p-valor bilateral del test U de Mann-Whitney (aproximación normal con
+    corrección por empates): ¿las dos muestras vienen de la misma distribución?
+    """
+    n1, n2 = len(a), len(b)
+    ranked = sorted([(value, 0) for value in a] + [(value, 1) for value in b])
+    ranks = [0.0] * len(ranked)
+    ties = 0.0
+    i = 0
+    while i < len(ranked):
+        j = i
+        while j + 1 < len(ranked) and ranked[j + 1][0] == ranked[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2 + 1
+        ties += (j - i + 1) ** 3 - (j - i + 1)
+        i = j + 1
+
+    rank_sum = sum(rank for rank, (_, group) in zip(ranks, ranked) if group == 0)
+    u = rank_sum - n1 * (n1 + 1) / 2
+    n = n1 + n2
+    variance = n1 * n2 / 12 * ((n + 1) - ties / (n * (n - 1)))
+    if variance <= 0:
+        return 1.0
+    z = (abs(u - n1 * n2 / 2) - 0.5) / math.sqrt(variance)
+    return min(1.0, math.erfc(max(z, 0.0) / math.sqrt(2)))
+
+
+COMPARED_LATENCIES = ("median_ms", "p90_ms", "p95_ms", "p99_ms")
+MIN_SAMPLES = 5
+
+
+def compare_to_baseline(
+    metrics: dict, baseline: dict, max_regression: float = 10.0, max_error_increase: float = 1.0, alpha: float = 0.05
+) -> dict:
+    """
+    Compara un run contra un baseline guardado con --save-baseline.
+
+    Una métrica regresa si empeora más que el presupuesto: `max_regression`
+    % para percentiles de latencia (más altos) y throughput (más bajo), y
+    `max_error_increase` puntos para el error rate. Si ambos runs tienen
+    snapshots por intervalo suficientes (`intervals`), una regresión solo
+    cuenta si además es significativa (Mann-Whitney U, p < `alpha`); sin
+    muestras suficientes, cuenta por el delta solo.
+    """
+    def series(data: dict, field: str) -> list:
+        rows = [row for row in data.get("intervals", []) if not row["warmup"] and row["requests"]]
+        if field == "rps":
+            rows = rows[:-1]  # El último intervalo es parcial
+        return [row[field] for row in rows]
+
+    def significance(field: str):
+        base, current = series(baseline, field), series(metrics, field)
+        if len(base) < MIN_SAMPLES or len(current) < MIN_SAMPLES:
+            return None
+        return round(mann_whitney_p(base, current), 4)
+
+    deltas = {}
+    for key in COMPARED_LATENCIES:
+        before, after = baseline["latency"][key], metrics["latency"][key]
+        delta = (after - before) / before * 100 if before else 0.0
+        p_value = significance("p50_ms" if key == "median_ms" else key)
+        deltas[key] = {
+            "baseline": before,
+            "current": after,
+            "delta_pct": round(delta, 1),
+            "p_value": p_value,
+            "regressed": delta > max_regression and (p_value is None or p_value < alpha),
+        }
+
+    before, after = baseline["rps"], metrics["rps"]
+    delta = (after - before) / before * 100 if before else 0.0
+    p_value = significance("rps")
+    deltas["rps"] = {
+        "baseline": before,
+        "current": after,
+        "delta_pct": round(delta, 1),
+        "p_value": p_value,
+        "regressed": -delta > max_regression and (p_value is None or p_value < alpha),
+    }
+
+    before, after = baseline["error_rate"], metrics["error_rate"]
+    deltas["error_rate"] = {
+        "baseline": before,
+        "current": after,
+        "delta_pct": round(after - before, 2),  # Puntos porcentuales
+        "p_value": None,
+        "regressed": after - before > max_error_increase,
+    }
+
+    return {
+        "max_regression_pct": max_regression,
+        "max_error_increase": max_error_increase,
+        "deltas": deltas,
+        "passed": not any(delta["regressed"] for delta in deltas.values()),
+    }
+
+
 def print_report(metrics: dict):
     """Imprime reporte de performance."""
     print("\n" + "=" * 50)
@@ -110,13 +1560,22 @@ def print_report(metrics: dict):
 
     if "error" in metrics:
         print(f"  ❌ {metrics['error']}")
+        for category, count in metrics.get("error_types", {}).items():
+            print(f"    {category}: {count}")
         return
 
     print(f"  URL:       {metrics['url']}")
     print(f"  Method:    {metrics['method']}")
     print(f"  Requests:  {metrics['total_requests']}")
     print(f"  Errors:    {metrics['failed']} ({metrics['error_rate']}%)")
-    print(f"  RPS:       {metrics['rps']}")
+    for category, count in sorted(metrics.get("error_types", {}).items(), key=lambda item: -item[1]):
+        print(f"    {category}: {count}")
+    if "target_rps" in metrics:
+        print(f"  RPS:       {metrics['rps']} (target {metrics['target_rps']})")
+    else:
+        print(f"  RPS:       {metrics['rps']}")
+    if "warmup_s" in metrics:
+        print(f"  Warm-up:   {metrics['warmup_s']:g}s ({metrics['warmup_requests']} requests excluidos)")
     print(f"  Total:     {metrics['total_time_s']}s")
 
     lat = metrics["latency"]
@@ -127,9 +1586,78 @@ def print_report(metrics: dict):
     print(f"    P90:    {lat['p90_ms']:.1f}ms")
     print(f"    P95:    {lat['p95_ms']:.1f}ms")
     print(f"    P99:    {lat['p99_ms']:.1f}ms")
+    print(f"    P99.9:  {lat['p999_ms']:.1f}ms")
     print(f"    Max:    {lat['max_ms']:.1f}ms")
     print(f"    Stdev:  {lat['stdev_ms']:.1f}ms")
 
+    if "latency_uncorrected" in metrics:
+        # Open-loop: la latencia de arriba ya incluye la espera por un servidor lento
+        raw = metrics["latency_uncorrected"]
+        print(f"\n  Latency (sin corregir, desde el envío real):")
+        print(f"    Median: {raw['median_ms']:.1f}ms")
+        print(f"    P90:    {raw['p90_ms']:.1f}ms")
+        print(f"    P95:    {raw['p95_ms']:.1f}ms")
+        print(f"    P99:    {raw['p99_ms']:.1f}ms")
+        print(f"    P99.9:  {raw['p999_ms']:.1f}ms")
+        print(f"    Max:    {raw['max_ms']:.1f}ms")
+
+    if metrics.get("phases"):
+        print(f"\n  Fases:")
+        print(f"    {'Fase':<12} {'Reqs':>7} {'P50':>9} {'P95':>9} {'P99':>9} {'Max':>9}")
+        for phase, ph in metrics["phases"].items():
+            print(
+                f"    {phase:<12} {ph['count']:>7} {ph['median_ms']:>7.2f}ms {ph['p95_ms']:>7.2f}ms "
+                f"{ph['p99_ms']:>7.2f}ms {ph['max_ms']:>7.2f}ms"
+            )
+
+    if "streaming" in metrics:
+        streaming = metrics["streaming"]
+        print(f"\n  Streaming: {streaming['responses']} respuestas, {streaming['chunks_per_response']:g} chunks/respuesta")
+        gap = streaming["chunk_gap"]
+        if gap:
+            print(
+                f"    Gap entre chunks: P50 {gap['median_ms']:.1f}ms | P95 {gap['p95_ms']:.1f}ms | "
+                f"P99 {gap['p99_ms']:.1f}ms | Max {gap['max_ms']:.1f}ms"
+            )
+
+    if metrics.get("endpoints"):
+        print(f"\n  Endpoints ({metrics['scenario']}):")
+        print(f"    {'Endpoint':<28} {'Reqs':>7} {'Err%':>6} {'P50':>9} {'P95':>9} {'P99':>9}")
+        for name, endpoint in metrics["endpoints"].items():
+            el = endpoint["latency"]
+            percentiles = (
+                f"{el['median_ms']:>7.1f}ms {el['p95_ms']:>7.1f}ms {el['p99_ms']:>7.1f}ms"
+                if el else f"{'-':>9} {'-':>9} {'-':>9}"
+            )
+            print(f"    {name[:28]:<28} {endpoint['requests']:>7} {endpoint['error_rate']:>6.1f} {percentiles}")
+
+    if "server_profile" in metrics:
+        profile = metrics["server_profile"]
+        print(f"\n  Server profile ({profile['samples']} muestras, stacks en {profile['stacks_file']}):")
+        print(f"    {'Ruta':<36} {'Reqs':>7} {'Mean':>9} {'Max':>9} {'SQL/req':>8}")
+        for route, stats in sorted(profile["routes"].items(), key=lambda item: -item[1]["count"]):
+            print(
+                f"    {route[:36]:<36} {stats['count']:>7} {stats['mean_ms']:>7.1f}ms "
+                f"{stats['max_ms']:>7.1f}ms {stats['sql_queries_per_request']:>8.1f}"
+            )
+
+    if "comparison" in metrics:
+        comparison = metrics["comparison"]
+        print(f"\n  Baseline (presupuesto {comparison['max_regression_pct']:g}%):")
+        print(f"    {'Métrica':<12} {'Baseline':>10} {'Actual':>10} {'Delta':>9} {'p':>7}")
+        for key, delta in comparison["deltas"].items():
+            unit = "pp" if key == "error_rate" else "%"
+            p_value = f"{delta['p_value']:.3f}" if delta["p_value"] is not None else "-"
+            flag = "  ❌" if delta["regressed"] else ""
+            print(
+                f"    {key:<12} {delta['baseline']:>10.1f} {delta['current']:>10.1f} "
+                f"{delta['delta_pct']:>+7.1f}{unit:<2} {p_value:>7}{flag}"
+            )
+        if comparison["passed"]:
+            print(f"    ✅ Sin regresiones fuera del presupuesto")
+        else:
+            print(f"    ❌ Regresión de performance respecto del baseline")
+
     # Evaluación
     print(f"\n  Assessment:")
     p95 = lat["p95_ms"]
@@ -147,22 +1675,125 @@ def print_report(metrics: dict):
 
 def main():
     parser = argparse.ArgumentParser(description="LMAgent Endpoint Profiler")
-    parser.add_argument("--url", "-u", required=True, help="URL del endpoint")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", "-u", help="URL del endpoint")
+    target.add_argument(
+        "--scenario", "-s",
+        help="Escenario YAML/JSON con endpoints ponderados, headers, bodies, variables y think times",
+    )
     parser.add_argument("--requests", "-n", type=int, default=100, help="Número de requests")
     parser.add_argument("--concurrent", "-c", type=int, default=5, help="Concurrencia")
     parser.add_argument("--method", "-m", default="GET", help="HTTP method")
+    parser.add_argument(
+        "--engine", "-e", choices=ENGINES, default=None,
+        help="thread: un thread y una conexión por request; async: event loop con conexiones keep-alive (miles de requests en vuelo); http2: streams multiplexados sobre una conexión HTTP/2 (requiere httpx[http2]). Default: thread, o async con --rate",
+    )
+    parser.add_argument(
+        "--rate", "-r", type=parse_rate, default=None,
+        help="Modo open-loop a tasa constante, ej. 100/s o 6000/m (--concurrent pasa a ser el máximo de conexiones)",
+    )
+    parser.add_argument(
+        "--workers", "-w", type=int, default=1,
+        help="Procesos generadores de carga (usa varios cores); requests, concurrencia y tasa se reparten entre ellos",
+    )
+    parser.add_argument(
+        "--interval", type=parse_duration, default=None,
+        help="Snapshot de throughput, errores y percentiles cada intervalo, ej. 1s (default 1s con --timeseries)",
+    )
+    parser.add_argument("--timeseries", default=None, help="Archivo para los snapshots por intervalo (.jsonl o .csv)")
+    parser.add_argument(
+        "--warmup", type=parse_duration, default=0.0,
+        help="Excluir de las métricas los requests de los primeros N segundos, ej. 30s",
+    )
+    parser.add_argument(
+        "--precision", type=int, choices=range(1, 6), default=2, metavar="{1-5}",
+        help="Dígitos significativos del histograma de latencias (2 = error <1%%)",
+    )
+    parser.add_argument("--save-baseline", default=None, help="Guardar este run como baseline (JSON)")
+    parser.add_argument(
+        "--baseline", default=None,
+        help="Comparar contra un baseline guardado; exit code 1 si hay regresión fuera del presupuesto",
+    )
+    parser.add_argument(
+        "--max-regression", type=float, default=10.0,
+        help="Presupuesto de regresión en %% para percentiles de latencia y throughput (default 10)",
+    )
+    parser.add_argument(
+        "--max-error-increase", type=float, default=1.0,
+        help="Aumento máximo del error rate en puntos porcentuales (default 1)",
+    )
+    parser.add_argument(
+        "--server-profile", nargs="?", const="server-profile.collapsed", default=None, metavar="FILE",
+        help="Perfilar el backend durante el run (/_profiling) y guardar sus stacks colapsados para flamegraph (default server-profile.collapsed)",
+    )
     parser.add_argument("--json", action="store_true", help="Output en JSON")
 
     args = parser.parse_args()
-    metrics = run_benchmark(args.url, args.requests, args.concurrent, args.method)
+    if args.rate and args.engine == "thread":
+        parser.error("--rate requiere el engine async o http2")
+    engine = args.engine or ("async" if args.rate else "thread")
+
+    # Los snapshots por intervalo son las muestras del test de significancia
+    comparing = args.baseline or args.save_baseline
+    interval = args.interval or (1.0 if args.timeseries or comparing else None)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    scenario = Scenario.load(args.scenario) if args.scenario else None
+    if args.server_profile:
+        base_url = (scenario or Scenario.single(args.url)).base_url
+        try:
+            server_profiling(base_url, "start")
+        except (urllib.error.URLError, OSError) as e:
+            sys.exit(f"❌ No se pudo iniciar el profiling del servidor: {error_category(e)} (¿PROFILING_ENABLED=true?)")
+
+    try:
+        metrics = run_benchmark(
+            args.url, args.requests, args.concurrent, args.method, engine, args.rate, args.precision, args.workers,
+            interval=interval, warmup=args.warmup, timeseries=args.timeseries, scenario=scenario,
+        )
+    finally:
+        # La sesión del servidor se cierra aunque el benchmark falle o se interrumpa
+        if args.server_profile:
+            try:
+                report = json.loads(server_profiling(base_url, "stop"))
+                stacks = server_profiling(base_url, "stacks", method="GET")
+            except (urllib.error.URLError, OSError, ValueError) as e:
+                report = None
+                print(f"⚠️  No se pudo cerrar el profiling del servidor: {error_category(e)}", file=sys.stderr)
+
+    if args.server_profile and report is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(args.server_profile)), exist_ok=True)
+        with open(args.server_profile, "wb") as f:
+            f.write(stacks)
+        metrics["server_profile"] = {
+            "samples": report["samples"],
+            "routes": report["routes"],
+            "stacks_file": args.server_profile,
+        }
+
+    if baseline is not None and "latency" in metrics:
+        metrics["comparison"] = compare_to_baseline(
+            metrics, baseline, args.max_regression, args.max_error_increase
+        )
+    if args.save_baseline and "latency" in metrics:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, "w") as f:
+            json.dump(metrics, f, indent=2)
 
     if args.json:
         print(json.dumps(metrics, indent=2))
     else:
         print_report(metrics)
 
-    # Exit code basado en P95
-    if metrics.get("latency", {}).get("p95_ms", 9999) > 1000:
+    # Exit code basado en P95, o en el baseline si se compara contra uno
+    if "comparison" in metrics:
+        if not metrics["comparison"]["passed"]:
+            sys.exit(1)
+    elif metrics.get("latency", {}).get("p95_ms", 9999) > 1000:
         sys.exit(1)
 
 
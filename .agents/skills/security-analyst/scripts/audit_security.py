@@ -8,30 +8,168 @@ Uso:
     python audit_security.py --path ./mi-proyecto --check secrets
     python audit_security.py --path ./mi-proyecto --check dependencies
     python audit_security.py --path ./mi-proyecto --check all
+    python audit_security.py --path ./mi-proyecto --check secrets --since origin/main
+    python audit_security.py --path ./mi-proyecto --check secrets --jobs 8 --no-cache
+    python audit_security.py --path ./mi-proyecto --check secrets --max-file-size 50MB --max-line-length 256KB
+    python audit_security.py --path ./mi-proyecto --format jsonl --fail-fast
+    python audit_security.py --path ./mi-proyecto --format sarif > audit.sarif
+
+El escaneo de secretos reparte los archivos en un pool de procesos y guarda
+un cache en .lmagent/cache/audit_secrets.json: los archivos sin cambios
+(mismo tamaño y mtime, o mismo hash de contenido) no se vuelven a escanear.
+Los archivos se leen por chunks (memoria acotada); los binarios se omiten y
+los demasiado grandes (o las líneas demasiado largas) se reportan como INFO.
+
+Todos los checks usan un único recorrido del proyecto (WalkIndex) que poda
+IGNORE_DIRS y lo que ignoran los .gitignore; el reporte incluye el tiempo
+de cada check.
+
+Dependencias: pip-audit y npm audit corren en paralelo y su resultado se
+cachea (.lmagent/cache/audit_deps.json) según el hash de requirements.txt /
+package-lock.json, por --deps-ttl. Con --advisory-db se evalúa offline
+contra un snapshot local en JSON, sin red:
+
+    {
+      "pypi": {"django": [{"id": "GHSA-xxxx", "severity": "HIGH",
+                           "vulnerable": ["<3.2.25", ">=4.0,<4.2.11"],
+                           "summary": "SQL injection en ..."}]},
+      "npm": {"lodash": [{"id": "GHSA-yyyy", "severity": "HIGH", "vulnerable": ["<4.17.21"]}]}
+    }
+
+    Cada entrada de "vulnerable" es un rango (condiciones separadas por
+    coma); la versión es vulnerable si cae en alguno.
+
+Con --format jsonl|sarif los hallazgos se escriben a stdout a medida que
+aparecen (un JSON por línea, o los results de un documento SARIF 2.1.0),
+seguidos de un resumen con la duración de cada check y archivos / bytes
+escaneados por segundo. --fail-fast corta en el primer hallazgo HIGH.
 """
 
 import argparse
+import hashlib
 import json
 import os
 import re
 import subprocess
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
+from typing import Iterator
 
 
-# Patrones de secretos comunes
+# Patrones de secretos comunes. Se buscan sobre bloques de varias líneas, así
+# que ninguno puede cruzar un salto de línea ([^\S\n] en lugar de \s).
 SECRET_PATTERNS = [
-    (r'(?i)(api[_-]?key|apikey)\s*[=:]\s*["\']?[A-Za-z0-9_\-]{16,}', "API Key"),
-    (r'(?i)(secret[_-]?key|secretkey)\s*[=:]\s*["\']?[A-Za-z0-9_\-]{16,}', "Secret Key"),
-    (r'(?i)(password|passwd|pwd)\s*[=:]\s*["\']?[^\s"\']{8,}', "Password"),
-    (r'(?i)(token)\s*[=:]\s*["\']?[A-Za-z0-9_\-\.]{20,}', "Token"),
-    (r'(?i)(aws[_-]?access[_-]?key)\s*[=:]\s*["\']?AKIA[A-Z0-9]{12,}', "AWS Access Key"),
-    (r'(?i)(private[_-]?key)\s*[=:]\s*["\']?-----BEGIN', "Private Key"),
-    (r'postgresql://[^:]+:[^@]+@', "Database Connection String"),
-    (r'mongodb(\+srv)?://[^:]+:[^@]+@', "MongoDB Connection String"),
-    (r'redis://[^:]*:[^@]+@', "Redis Connection String"),
+    (r'(?i)(api[_-]?key|apikey)[^\S\n]*[=:][^\S\n]*["\']?[A-Za-z0-9_\-]{16,}', "API Key"),
+    (r'(?i)(secret[_-]?key|secretkey)[^\S\n]*[=:][^\S\n]*["\']?[A-Za-z0-9_\-]{16,}', "Secret Key"),
+    (r'(?i)(password|passwd|pwd)[^\S\n]*[=:][^\S\n]*["\']?[^\s"\']{8,}', "Password"),
+    (r'(?i)(token)[^\S\n]*[=:][^\S\n]*["\']?[A-Za-z0-9_\-\.]{20,}', "Token"),
+    (r'(?i)(aws[_-]?access[_-]?key)[^\S\n]*[=:][^\S\n]*["\']?AKIA[A-Z0-9]{12,}', "AWS Access Key"),
+    (r'(?i)(private[_-]?key)[^\S\n]*[=:][^\S\n]*["\']?-----BEGIN', "Private Key"),
+    (r'postgresql://[^:\n]+:[^@\n]+@', "Database Connection String"),
+    (r'mongodb(\+srv)?://[^:\n]+:[^@\n]+@', "MongoDB Connection String"),
+    (r'redis://[^:\n]*:[^@\n]+@', "Redis Connection String"),
 ]
 
+# Todo match de SECRET_PATTERNS contiene alguno de estos literales (en
+# minúsculas): los archivos sin ninguno no pasan por la regex.
+# Al agregar un patrón, agregar su literal acá.
+PREFILTER_LITERALS = ["api", "secret", "pass", "pwd", "token", "akia", "private", "://"]
+
+# Líneas con estos textos son placeholders o lecturas de variables de entorno
+PLACEHOLDERS = [
+    "example", "placeholder", "change-me",
+    "your-", "xxx", "todo", "fixme",
+    "os.getenv", "process.env", "environ",
+]
+
+
+# Con (?i), `re` además hace coincidir estos caracteres con la letra ASCII,
+# aunque lower()/upper() no los conviertan entre sí
+CASE_VARIANTS = {"i": "ıİ", "k": "K", "s": "ſ"}
+
+
+def _leading_chars(pattern: str, ignore_case: bool) -> set[str] | None:
+    """
+    Caracteres con los que puede empezar un match de `pattern`, si empieza
+    con un literal o con un grupo de alternativas literales; si no, None.
+    """
+    group = re.match(r"\(([^()]*)\)", pattern)
+    alternatives = group.group(1).split("|") if group else [pattern]
+    chars = set()
+    for alternative in alternatives:
+        if not alternative[:1].isalnum():
+            return None
+        chars.add(alternative[0])
+        if ignore_case:
+            chars |= {alternative[0].lower(), alternative[0].upper()}
+            chars |= set(CASE_VARIANTS.get(alternative[0].lower(), ""))
+    return chars
+
+
+def compile_secret_patterns(patterns: list[tuple[str, str]]) -> tuple[re.Pattern, list[tuple[re.Pattern, str]]]:
+    """
+    Combina los patrones en una sola alternancia, que encuentra en una
+    pasada las líneas con algún secreto. Retorna esa regex y la de cada
+    patrón con su tipo.
+
+    Los matches de la alternancia no se solapan (un patrón puede consumir
+    el texto de otro), así que solo sirve para ubicar líneas: cada línea
+    con un hit se vuelve a evaluar con cada patrón por separado.
+
+    `re` no descarta posiciones por el primer carácter de una alternancia,
+    así que si todos los patrones empiezan con un literal se antepone un
+    lookahead con esos caracteres (~3x más rápido sobre código típico).
+    """
+    alternatives = []
+    first_chars = set()
+    for pattern, _ in patterns:
+        # Los flags globales como (?i) pasan a ser locales al grupo
+        flags = re.match(r"\(\?([aiLmsux]+)\)", pattern)
+        if flags:
+            pattern = pattern[flags.end():]
+        leading = _leading_chars(pattern, bool(flags and "i" in flags.group(1)))
+        first_chars = None if first_chars is None or leading is None else first_chars | leading
+        if flags:
+            pattern = f"(?{flags.group(1)}:{pattern})"
+        alternatives.append(f"(?:{pattern})")
+
+    combined = "|".join(alternatives)
+    if first_chars:
+        combined = f"(?=[{re.escape(''.join(sorted(first_chars)))}])(?:{combined})"
+    return re.compile(combined), [(re.compile(pattern), secret_type) for pattern, secret_type in patterns]
+
+
+SECRET_REGEX, SECRET_LINE_PATTERNS = compile_secret_patterns(SECRET_PATTERNS)
+
+# lower() no convierte todas estas variantes: un bloque con alguna no se
+# descarta por el prefiltro
+CASE_VARIANT_CHARS = "".join(CASE_VARIANTS.values())
+
+# Subir al cambiar cómo se evalúan los patrones (invalida el cache)
+SCANNER_REVISION = 4
+
+# Cambia con cualquier patrón, literal o placeholder: invalida el cache
+PATTERNS_VERSION = hashlib.sha256(
+    json.dumps([SECRET_PATTERNS, PREFILTER_LITERALS, PLACEHOLDERS, SCANNER_REVISION]).encode()
+).hexdigest()[:16]
+
+CACHE_FILE = Path(".lmagent") / "cache" / "audit_secrets.json"
+DEPS_CACHE_FILE = Path(".lmagent") / "cache" / "audit_deps.json"
+DEPS_CACHE_TTL = 24 * 3600
+
+# Por debajo de esta cantidad de archivos a escanear no conviene levantar procesos
+PARALLEL_MIN_FILES = 64
+
+# Lectura por chunks: memoria acotada a READ_CHUNK + max_line_length por archivo
+READ_CHUNK = 1024 * 1024
+MAX_FILE_SIZE = 20 * 1024 * 1024
+MAX_LINE_LENGTH = 1024 * 1024
+
+# Un byte nulo en el comienzo del archivo = binario
+BINARY_SNIFF_BYTES = 8192
+
 # Extensiones a escanear
 SCAN_EXTENSIONS = {
     ".py", ".js", ".ts", ".jsx", ".tsx", ".env", ".yaml", ".yml",
@@ -45,67 +183,539 @@ IGNORE_DIRS = {
 }
 
 
-def scan_secrets(project_path: Path) -> list[dict]:
-    """Escanea archivos buscando secretos hardcodeados."""
-    findings = []
+def find_secrets(content: bytes, first_line: int = 1) -> list[tuple[int, str, str]]:
+    """
+    Busca secretos en un bloque de líneas completas (empezando en la línea
+    `first_line`). Retorna (número de línea, tipo, línea) por cada patrón
+    que matchea en una línea, sin contar los placeholders: lo mismo que
+    evaluar cada patrón línea por línea.
+
+    El bloque se decodifica como texto (igual que leer el archivo con
+    errors="ignore"), así los largos mínimos cuentan caracteres y \\s
+    incluye los espacios Unicode. Los bloques sin ningún literal de
+    PREFILTER_LITERALS se descartan sin correr la regex; la regex combinada
+    ubica en una pasada las líneas con hits, y solo esas se evalúan patrón
+    por patrón. Los números de línea se calculan solo para los hits.
+    """
+    text = content.decode("utf-8", errors="ignore")
+    lowered = text.lower()
+    if not any(literal in lowered for literal in PREFILTER_LITERALS) and (
+        text.isascii() or not any(char in text for char in CASE_VARIANT_CHARS)
+    ):
+        return []
+
+    hits = []
+    line_num, counted_to = first_line, 0
+    pos = 0
+    while match := SECRET_REGEX.search(text, pos):
+        start = text.rfind("\n", 0, match.start()) + 1
+        end = text.find("\n", match.end())
+        if end == -1:
+            end = len(text)
+        pos = end + 1
+
+        # Verificar que no es un placeholder
+        line = text[start:end]
+        if any(ph in line.lower() for ph in PLACEHOLDERS):
+            continue
+
+        line_num += text.count("\n", counted_to, start)
+        counted_to = start
+        # Un hallazgo por patrón y línea
+        for regex, secret_type in SECRET_LINE_PATTERNS:
+            if regex.search(line):
+                hits.append((line_num, secret_type, line))
+    return hits
+
+
+class ChunkScanner:
+    """
+    Escanea un archivo que llega por chunks con `find_secrets`.
+
+    Solo se escanean líneas completas: la última línea de cada chunk queda
+    pendiente hasta el próximo, así ningún match queda partido entre dos
+    chunks (los patrones no cruzan saltos de línea). Las líneas de más de
+    `max_line_length` (completas, o la pendiente, que se descarta hasta el
+    próximo salto de línea) no se escanean y se registran en `long_lines`.
+    """
 
-    for root, dirs, files in os.walk(project_path):
-        # Filtrar directorios ignorados
-        dirs[:] = [d for d in dirs if d not in IGNORE_DIRS]
+    def __init__(self, max_line_length: int = MAX_LINE_LENGTH):
+        self.max_line_length = max_line_length
+        self.pending = b""
+        self.line = 1
+        self.skipping = False
+        self.hits = []
+        self.long_lines = []
 
-        for filename in files:
-            filepath = Path(root) / filename
+    def feed(self, chunk: bytes):
+        if self.skipping:
+            newline = chunk.find(b"\n")
+            if newline == -1:
+                return
+            chunk = chunk[newline + 1:]
+            self.line += 1
+            self.skipping = False
 
-            # Solo escanear extensiones relevantes
-            if filepath.suffix not in SCAN_EXTENSIONS:
+        buffer = self.pending + chunk if self.pending else chunk
+        end = buffer.rfind(b"\n") + 1
+        if end:
+            self.scan_lines(buffer[:end])
+        self.pending = buffer[end:]
+        if len(self.pending) > self.max_line_length:
+            self.long_lines.append(self.line)
+            self.pending = b""
+            self.skipping = True
+
+    def scan_lines(self, block: bytes):
+        """Escanea un bloque de líneas completas, salteando las demasiado largas."""
+        start = 0
+        for line_start, line_end in self.find_long_lines(block):
+            self.hits.extend(find_secrets(block[start:line_start], self.line))
+            self.line += block.count(b"\n", start, line_start)
+            self.long_lines.append(self.line)
+            self.line += 1
+            start = line_end + 1
+        self.hits.extend(find_secrets(block[start:], self.line))
+        self.line += block.count(b"\n", start)
+
+    def find_long_lines(self, block: bytes) -> Iterator[tuple[int, int]]:
+        """
+        (inicio, fin) de las líneas de `block` más largas que
+        `max_line_length`. En vez de medir cada línea se recorre el bloque en
+        ventanas de max_line_length / 2: una línea más larga contiene alguna
+        ventana completa sin saltos de línea, y solo esas se miden.
+        """
+        limit = self.max_line_length
+        if len(block) <= limit:
+            return
+        window = max(limit // 2, 1)
+        pos = 0
+        while pos < len(block):
+            if block.find(b"\n", pos, pos + window) != -1:
+                pos += window
                 continue
+            start = block.rfind(b"\n", 0, pos) + 1
+            end = block.find(b"\n", pos)
+            if end - start > limit:
+                yield start, end
+            pos = end + 1
+
+    def close(self):
+        if self.pending:
+            self.hits.extend(find_secrets(self.pending, self.line))
+            self.pending = b""
+
+
+def is_scannable(filepath: Path) -> bool:
+    """Extensión relevante y no es un .example / .template."""
+    if filepath.suffix not in SCAN_EXTENSIONS:
+        return False
+    return ".example" not in filepath.name and ".template" not in filepath.name
+
 
-            # Ignorar archivos .example y .template
-            if ".example" in filepath.name or ".template" in filepath.name:
+def compile_gitignore_pattern(pattern: str) -> re.Pattern:
+    """Traduce un glob de .gitignore (*, ?, [...], **) a una regex sobre rutas con /."""
+    parts = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            parts.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            parts.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 1:]:
+            end = pattern.index("]", i + 1)
+            parts.append("[" + pattern[i + 1:end].replace("!", "^", 1) + "]")
+            i = end + 1
+        else:
+            parts.append(re.escape(pattern[i]))
+            i += 1
+    return re.compile("".join(parts) + r"\Z")
+
+
+class GitIgnore:
+    """
+    Reglas de un .gitignore, relativas a su directorio (`base`, con / final
+    o vacío para la raíz). Soporta negación (!), reglas solo para
+    directorios (/ final), reglas ancladas (con / en el medio o al inicio)
+    y **. Como git, la última regla que matchea decide.
+    """
+
+    def __init__(self, base: str, text: str):
+        self.base = base
+        self.rules = []
+        for line in text.splitlines():
+            line = line.rstrip()
+            if not line or line.startswith("#"):
                 continue
+            negate = line.startswith("!")
+            if negate:
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            anchored = "/" in line
+            self.rules.append((compile_gitignore_pattern(line.lstrip("/")), negate, dir_only, anchored))
 
-            try:
-                content = filepath.read_text(encoding="utf-8", errors="ignore")
-                for line_num, line in enumerate(content.split("\n"), 1):
-                    for pattern, secret_type in SECRET_PATTERNS:
-                        if re.search(pattern, line):
-                            # Verificar que no es un placeholder
-                            if any(ph in line.lower() for ph in [
-                                "example", "placeholder", "change-me",
-                                "your-", "xxx", "todo", "fixme",
-                                "os.getenv", "process.env", "environ",
-                            ]):
-                                continue
-
-                            findings.append({
-                                "type": secret_type,
-                                "file": str(filepath.relative_to(project_path)),
-                                "line": line_num,
-                                "severity": "HIGH",
-                                "snippet": line.strip()[:80] + "...",
-                            })
-            except (UnicodeDecodeError, PermissionError):
+    def match(self, rel_path: str, is_dir: bool) -> bool | None:
+        """True (ignorado), False (re-incluido con !) o None si ninguna regla aplica."""
+        if not rel_path.startswith(self.base):
+            return None
+        path = rel_path[len(self.base):]
+        name = path.rpartition("/")[2]
+        result = None
+        for regex, negate, dir_only, anchored in self.rules:
+            if dir_only and not is_dir:
                 continue
+            if regex.match(path if anchored else name):
+                result = not negate
+        return result
+
+
+class WalkIndex:
+    """
+    Un solo recorrido del proyecto compartido por todos los checks. Poda los
+    directorios de IGNORE_DIRS y todo lo que ignoran los .gitignore (el de la
+    raíz y los de cada subdirectorio), así no se entra a node_modules, builds
+    ni entornos virtuales.
+    """
+
+    def __init__(self, project_path: Path):
+        self.root = project_path
+        self.files = []
+        self.pruned = 0
+        start = time.perf_counter()
+        self._walk()
+        self.duration = time.perf_counter() - start
+
+    def _walk(self):
+        ignores = []
+        for root, dirs, files in os.walk(self.root):
+            rel_root = os.path.relpath(root, self.root)
+            prefix = "" if rel_root == "." else rel_root.replace(os.sep, "/") + "/"
+            # Las reglas de directorios hermanos ya no aplican
+            ignores = [ignore for ignore in ignores if prefix.startswith(ignore.base)]
+            if ".gitignore" in files:
+                try:
+                    ignores.append(GitIgnore(prefix, (Path(root) / ".gitignore").read_text(errors="ignore")))
+                except OSError:
+                    pass
+
+            kept = []
+            for d in dirs:
+                if d in IGNORE_DIRS or self._ignored(ignores, prefix + d, True):
+                    self.pruned += 1
+                else:
+                    kept.append(d)
+            dirs[:] = kept
+
+            for filename in files:
+                if not self._ignored(ignores, prefix + filename, False):
+                    self.files.append(Path(root) / filename)
+
+    @staticmethod
+    def _ignored(ignores: list[GitIgnore], rel_path: str, is_dir: bool) -> bool:
+        ignored = False
+        for ignore in ignores:
+            result = ignore.match(rel_path, is_dir)
+            if result is not None:
+                ignored = result
+        return ignored
+
+    def named(self, names: set[str]) -> list[Path]:
+        """Archivos del índice cuyo nombre está en `names`."""
+        return [filepath for filepath in self.files if filepath.name in names]
+
+
+def changed_files(project_path: Path, ref: str) -> list[Path]:
+    """
+    Archivos modificados respecto de `ref` (commits, staged y working tree)
+    más los untracked que no ignora git, filtrados como en el escaneo completo.
+    """
+    commands = [
+        ["git", "diff", "--name-only", "--relative", "--diff-filter=d", ref, "--"],
+        ["git", "ls-files", "--others", "--exclude-standard"],
+    ]
+    names = set()
+    for command in commands:
+        result = subprocess.run(command, capture_output=True, text=True, cwd=str(project_path))
+        if result.returncode != 0:
+            error = result.stderr.strip().splitlines()
+            raise ValueError(error[0] if error else f"git falló: {' '.join(command)}")
+        names.update(line for line in result.stdout.splitlines() if line)
+
+    files = []
+    for name in sorted(names):
+        filepath = project_path / name
+        if set(Path(name).parts[:-1]) & IGNORE_DIRS or not is_scannable(filepath):
+            continue
+        if filepath.is_file():
+            files.append(filepath)
+    return files
+
+
+class ScanCache:
+    """
+    Hallazgos por archivo de escaneos anteriores, en JSON. Una entrada vale
+    si coinciden tamaño y mtime, o (si cambió el mtime) el hash del
+    contenido; todo el cache se descarta si cambia `version` (PATTERNS_VERSION
+    y los límites del escaneo).
+    """
+
+    def __init__(self, path: Path, version: str = PATTERNS_VERSION):
+        self.path = path
+        self.version = version
+        self.entries = {}
+        try:
+            data = json.loads(path.read_text())
+            if data.get("version") == version:
+                self.entries = data["files"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def get(self, name: str) -> dict | None:
+        return self.entries.get(name)
+
+    def put(self, name: str, size: int, mtime_ns: int, digest: str, findings: list[dict]):
+        self.entries[name] = {"size": size, "mtime_ns": mtime_ns, "hash": digest, "findings": findings}
+
+    def prune(self, names: set[str]):
+        """Descarta las entradas de archivos que ya no se escanean."""
+        self.entries = {name: entry for name, entry in self.entries.items() if name in names}
+
+    def save(self):
+        write_cache(self.path, {"version": self.version, "files": self.entries})
+
+
+def write_cache(path: Path, data: dict):
+    """Escribe un cache JSON de forma atómica en un directorio que git ignora."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Los caches guardan fragmentos de los secretos encontrados: nunca versionarlos
+    gitignore = path.parent / ".gitignore"
+    if not gitignore.exists():
+        gitignore.write_text("*\n")
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(data))
+    os.replace(tmp, path)
+
+
+def hash_file(f, head: bytes) -> str:
+    """blake2b de `head` más el resto de `f` (leído por chunks)."""
+    digest = hashlib.blake2b(head, digest_size=16)
+    for chunk in iter(lambda: f.read(READ_CHUNK), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def scan_file(task: tuple[str, str, str | None, int]) -> tuple[str, str, list[dict] | None]:
+    """
+    Escanea un archivo por chunks (corre en los procesos del pool). `task`
+    es (ruta, nombre relativo, hash cacheado, largo máximo de línea).
+    Retorna (nombre, hash, hallazgos), con hallazgos None si el hash
+    coincide con el cacheado. Los binarios se omiten sin leerlos completos.
+    """
+    path, name, cached_hash, max_line_length = task
+    scanner = ChunkScanner(max_line_length)
+    try:
+        with open(path, "rb") as f:
+            head = f.read(READ_CHUNK)
+            if b"\0" in head[:BINARY_SNIFF_BYTES]:
+                return name, "binary", []
+
+            if cached_hash is not None:
+                # Primero solo el hash: si no cambió, no hace falta la regex
+                digest = hash_file(f, head)
+                if digest == cached_hash:
+                    return name, digest, None
+                f.seek(len(head))
+                chunks = iter(lambda: f.read(READ_CHUNK), b"")
+            else:
+                hasher = hashlib.blake2b(digest_size=16)
+
+                def hashed_chunks():
+                    for chunk in iter(lambda: f.read(READ_CHUNK), b""):
+                        hasher.update(chunk)
+                        yield chunk
+
+                hasher.update(head)
+                chunks = hashed_chunks()
+
+            scanner.feed(head)
+            for chunk in chunks:
+                scanner.feed(chunk)
+            scanner.close()
+            if cached_hash is None:
+                digest = hasher.hexdigest()
+    except OSError:
+        return name, "", []
+
+    findings = [
+        {
+            "type": secret_type,
+            "file": name,
+            "line": line_num,
+            "severity": "HIGH",
+            "snippet": line.strip()[:80] + "...",
+        }
+        for line_num, secret_type, line in scanner.hits
+    ]
+    findings += [
+        {
+            "type": "Skipped: line too long",
+            "file": name,
+            "line": line_num,
+            "severity": "INFO",
+            "recommendation": f"Línea de más de {max_line_length} bytes sin escanear (¿archivo generado o minificado?)",
+        }
+        for line_num in scanner.long_lines
+    ]
+    return name, digest, findings
+
+
+def parse_size(value: str) -> int:
+    """Parsea un tamaño: "1048576", "512KB", "20MB" o "1GB" → bytes."""
+    text = value.strip().upper().removesuffix("B")
+    factor = 1
+    for suffix, multiplier in (("K", 1024), ("M", 1024 ** 2), ("G", 1024 ** 3)):
+        if text.endswith(suffix):
+            text, factor = text[:-1], multiplier
+            break
+    try:
+        size = int(float(text) * factor)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Tamaño inválido: {value!r} (ej. 512KB, 20MB)")
+    if size <= 0:
+        raise argparse.ArgumentTypeError(f"El tamaño debe ser positivo: {value!r}")
+    return size
+
+
+class ScanStats:
+    """Contadores del escaneo de secretos para el resumen."""
+
+    def __init__(self):
+        self.files = 0
+        self.cached = 0
+        self.bytes = 0
+
+
+def iter_secrets(
+    project_path: Path,
+    files: list[Path] = None,
+    use_cache: bool = True,
+    jobs: int = None,
+    max_file_size: int = MAX_FILE_SIZE,
+    max_line_length: int = MAX_LINE_LENGTH,
+    index: WalkIndex = None,
+    stats: ScanStats = None,
+) -> Iterator[dict]:
+    """
+    Escanea archivos buscando secretos hardcodeados: todo el proyecto (los
+    archivos de `index`), o solo `files` (ej. `changed_files` para --since).
+    Genera los hallazgos a medida que terminan los archivos (sin orden).
+
+    Los archivos sin cambios desde el último escaneo salen del cache (ver
+    `ScanCache`); el resto se reparte entre `jobs` procesos (default: un
+    proceso por CPU). Los archivos de más de `max_file_size` bytes no se
+    leen y quedan como hallazgo INFO. Si se deja de consumir el generador
+    (ej. --fail-fast), los archivos pendientes se cancelan.
+    """
+    stats = stats or ScanStats()
+    full_scan = files is None
+    if full_scan:
+        files = [filepath for filepath in (index or WalkIndex(project_path)).files if is_scannable(filepath)]
+    cache_path = project_path / CACHE_FILE
+    cache = ScanCache(cache_path, f"{PATTERNS_VERSION}:{max_line_length}") if use_cache else None
+
+    stat_by_name = {}
+    tasks = []
+    for filepath in files:
+        if filepath == cache_path:
+            continue
+        name = str(filepath.relative_to(project_path))
+        try:
+            stat = filepath.stat()
+        except OSError:
+            continue
+        stat_by_name[name] = stat
+        stats.files += 1
+        if stat.st_size > max_file_size:
+            yield {
+                "type": "Skipped: too large",
+                "file": name,
+                "severity": "INFO",
+                "recommendation": f"{stat.st_size / 1024 ** 2:.1f} MB sin escanear (límite --max-file-size)",
+            }
+            continue
+        entry = cache.get(name) if cache else None
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            stats.cached += 1
+            yield from entry["findings"]
+            continue
+        tasks.append((str(filepath), name, entry["hash"] if entry else None, max_line_length))
+
+    jobs = jobs or os.cpu_count() or 1
+    pool = None
+    if jobs > 1 and len(tasks) >= PARALLEL_MIN_FILES:
+        pool = ProcessPoolExecutor(jobs)
+        results = pool.map(scan_file, tasks, chunksize=max(1, len(tasks) // (jobs * 8)))
+    else:
+        results = map(scan_file, tasks)
+
+    completed = False
+    try:
+        for name, digest, file_findings in results:
+            stat = stat_by_name[name]
+            if file_findings is None:
+                stats.cached += 1
+                file_findings = cache.get(name)["findings"]
+            else:
+                stats.bytes += stat.st_size
+            if cache is not None and digest:
+                cache.put(name, stat.st_size, stat.st_mtime_ns, digest, file_findings)
+            yield from file_findings
+        completed = True
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        if cache is not None:
+            if full_scan and completed:
+                cache.prune(set(stat_by_name))
+            try:
+                cache.save()
+            except OSError:
+                pass
 
+
+def scan_secrets(project_path: Path, files: list[Path] = None, **options) -> list[dict]:
+    """Todos los hallazgos de `iter_secrets`, ordenados por archivo y línea."""
+    findings = list(iter_secrets(project_path, files, **options))
+    findings.sort(key=lambda f: (f["file"], f.get("line", 0)))
     return findings
 
 
-def check_env_file(project_path: Path) -> list[dict]:
-    """Verifica que no haya archivos .env versionados."""
-    findings = []
+ENV_FILES = {".env", ".env.local", ".env.production"}
 
-    env_files = list(project_path.glob("**/.env"))
-    env_files += list(project_path.glob("**/.env.local"))
-    env_files += list(project_path.glob("**/.env.production"))
 
-    for env_file in env_files:
-        if ".git" not in str(env_file):
-            findings.append({
-                "type": "Unprotected .env file",
-                "file": str(env_file.relative_to(project_path)),
-                "severity": "MEDIUM",
-                "recommendation": "Asegurar que .env esté en .gitignore",
-            })
+def check_env_file(project_path: Path, index: WalkIndex = None) -> list[dict]:
+    """
+    Verifica que no haya archivos .env versionados. Los que ignora un
+    .gitignore no aparecen en el índice, así que no se reportan.
+    """
+    findings = []
+
+    for env_file in (index or WalkIndex(project_path)).named(ENV_FILES):
+        findings.append({
+            "type": "Unprotected .env file",
+            "file": str(env_file.relative_to(project_path)),
+            "severity": "MEDIUM",
+            "recommendation": "Asegurar que .env esté en .gitignore",
+        })
 
     # Verificar .gitignore
     gitignore = project_path / ".gitignore"
@@ -122,60 +732,373 @@ def check_env_file(project_path: Path) -> list[dict]:
     return findings
 
 
-def check_dependencies(project_path: Path) -> list[dict]:
-    """Verifica vulnerabilidades en dependencias."""
+def audit_python(req_file: Path) -> tuple[list[dict], bool]:
+    """
+    pip-audit sobre requirements.txt. Retorna (hallazgos, si el resultado es
+    cacheable): solo se cachea una auditoría que terminó, con o sin
+    vulnerabilidades; un error de red o de resolución no.
+    """
     findings = []
-
-    # Python: pip audit
-    req_file = project_path / "requirements.txt"
-    if req_file.exists():
+    try:
+        result = subprocess.run(
+            [sys.executable, "-m", "pip_audit", "-r", str(req_file), "-f", "json"],
+            capture_output=True, text=True, timeout=60
+        )
+        if "No module named pip_audit" in result.stderr:
+            raise FileNotFoundError("pip_audit")
+        # pip-audit sale con 1 tanto si encuentra vulnerabilidades como si
+        # falla: solo el reporte JSON distingue una auditoría completa
         try:
-            result = subprocess.run(
-                [sys.executable, "-m", "pip", "audit", "-r", str(req_file)],
-                capture_output=True, text=True, timeout=60
-            )
-            if result.returncode != 0:
+            report = json.loads(result.stdout)
+        except ValueError:
+            error = result.stderr.strip().splitlines()
+            findings.append({
+                "type": "pip-audit failed",
+                "severity": "INFO",
+                "recommendation": error[-1][:300] if error else f"pip-audit salió con código {result.returncode}",
+            })
+            return findings, False
+        dependencies = report.get("dependencies", []) if isinstance(report, dict) else report
+        vulnerable = [
+            f"{dep['name']}=={dep['version']} ({', '.join(vuln['id'] for vuln in dep['vulns'])})"
+            for dep in dependencies if dep.get("vulns")
+        ]
+        if vulnerable:
+            findings.append({
+                "type": "Python dependency vulnerabilities",
+                "output": "; ".join(vulnerable)[:500],
+                "severity": "HIGH",
+            })
+    except (FileNotFoundError, subprocess.TimeoutExpired):
+        findings.append({
+            "type": "pip-audit not available",
+            "severity": "INFO",
+            "recommendation": "Instalar: pip install pip-audit",
+        })
+        return findings, False
+    return findings, True
+
+
+def audit_node(project_path: Path) -> tuple[list[dict], bool]:
+    """npm audit sobre package.json / package-lock.json. Retorna (hallazgos, si el resultado es cacheable)."""
+    findings = []
+    try:
+        result = subprocess.run(
+            ["npm", "audit", "--json"],
+            capture_output=True, text=True,
+            cwd=str(project_path), timeout=60
+        )
+        if result.returncode != 0:
+            try:
+                audit_data = json.loads(result.stdout)
+                # Error de npm (red, registry): no es un resultado de la auditoría
+                if "error" in audit_data:
+                    return findings, False
+                vuln_count = audit_data.get("metadata", {}).get("vulnerabilities", {})
+                findings.append({
+                    "type": "NPM dependency vulnerabilities",
+                    "high": vuln_count.get("high", 0),
+                    "critical": vuln_count.get("critical", 0),
+                    "severity": "HIGH" if vuln_count.get("critical", 0) > 0 else "MEDIUM",
+                })
+            except json.JSONDecodeError:
+                return findings, False
+    except (FileNotFoundError, subprocess.TimeoutExpired):
+        return findings, False
+    return findings, True
+
+
+def parse_requirements(req_file: Path) -> dict[str, set[str]]:
+    """Dependencias fijadas (nombre==versión) de un requirements.txt; el resto no se puede evaluar."""
+    packages = {}
+    for line in req_file.read_text(errors="ignore").splitlines():
+        line = line.split("#", 1)[0].split(";", 1)[0].strip()
+        match = re.match(r"([A-Za-z0-9][A-Za-z0-9._-]*)(?:\[[^\]]*\])?\s*===?\s*([^\s,]+)$", line)
+        if match:
+            # Nombres normalizados como en PyPI (PEP 503)
+            packages.setdefault(re.sub(r"[-_.]+", "-", match.group(1)).lower(), set()).add(match.group(2))
+    return packages
+
+
+def parse_package_lock(lock_file: Path) -> dict[str, set[str]]:
+    """
+    Versiones instaladas de un package-lock.json (formato v1, v2 o v3). Un
+    paquete puede estar varias veces (copias anidadas en node_modules de
+    otros paquetes): se juntan todas sus versiones.
+    """
+    data = json.loads(lock_file.read_text())
+    packages = {}
+    if "packages" in data:
+        for path, info in data["packages"].items():
+            if path and "version" in info:
+                packages.setdefault(path.rpartition("node_modules/")[2], set()).add(info["version"])
+        return packages
+
+    def walk(dependencies: dict):
+        for name, info in dependencies.items():
+            if "version" in info:
+                packages.setdefault(name, set()).add(info["version"])
+            walk(info.get("dependencies", {}))
+
+    walk(data.get("dependencies", {}))
+    return packages
+
+
+def version_key(version: str) -> tuple:
+    """
+    Clave comparable de una versión: 1.10.0 > 1.9.2, los pre-releases
+    (1.0.0-rc1, 1.0a1) antes del release y los post / builds después.
+    """
+    text = version.strip().lstrip("v=^~")
+    match = re.match(r"\d+(?:\.\d+)*", text)
+    numbers = tuple(int(part) for part in match.group(0).split(".")) if match else (0,)
+    numbers += (0,) * max(0, 4 - len(numbers))
+    suffix = text[match.end():] if match else text
+    if not suffix:
+        return numbers, (1, "")
+    return numbers, (2 if "post" in suffix or suffix.startswith("+") else 0, suffix)
+
+
+def version_in_range(version: str, spec: str) -> bool:
+    """¿`version` cumple todas las condiciones de `spec` (ej. ">=4.0,<4.2.11")?"""
+    key = version_key(version)
+    for condition in spec.split(","):
+        match = re.match(r"\s*(<=|>=|==|!=|<|>|=)?\s*(\S+)", condition)
+        if not match:
+            continue
+        op, bound = match.group(1) or "==", version_key(match.group(2))
+        ok = {
+            "<": key < bound, "<=": key <= bound, ">": key > bound, ">=": key >= bound,
+            "==": key == bound, "=": key == bound, "!=": key != bound,
+        }[op]
+        if not ok:
+            return False
+    return True
+
+
+def load_advisory_db(path: str) -> dict:
+    """Snapshot local de advisories (formato en el docstring del módulo)."""
+    with open(path) as f:
+        db = json.load(f)
+    # Nombres de PyPI normalizados para comparar con parse_requirements
+    db["pypi"] = {re.sub(r"[-_.]+", "-", name).lower(): advisories for name, advisories in db.get("pypi", {}).items()}
+    return db
+
+
+def audit_offline(packages: dict[str, set[str]], advisories: dict, source: str) -> list[dict]:
+    """Un hallazgo por (paquete, versión, advisory) cuya versión cae en un rango vulnerable."""
+    findings = []
+    for name, versions in sorted(packages.items()):
+        for version in sorted(versions, key=version_key):
+            for advisory in advisories.get(name, []):
+                if not any(version_in_range(version, spec) for spec in advisory.get("vulnerable", [])):
+                    continue
                 findings.append({
-                    "type": "Python dependency vulnerabilities",
-                    "output": result.stdout[:500],
-                    "severity": "HIGH",
+                    "type": f"Vulnerable dependency: {name}=={version} ({advisory.get('id', '?')})",
+                    "file": source,
+                    "severity": advisory.get("severity", "HIGH").upper(),
+                    "recommendation": advisory.get("summary", "Actualizar a una versión fuera del rango vulnerable"),
                 })
-        except (FileNotFoundError, subprocess.TimeoutExpired):
+    return findings
+
+
+def lockfile_hash(*paths: Path) -> str:
+    digest = hashlib.sha256()
+    for path in paths:
+        if path.exists():
+            digest.update(path.name.encode() + b"\0" + path.read_bytes())
+    return digest.hexdigest()[:32]
+
+
+def check_dependencies(
+    project_path: Path, use_cache: bool = True, ttl: float = DEPS_CACHE_TTL, advisory_db: dict = None
+) -> list[dict]:
+    """
+    Verifica vulnerabilidades en dependencias.
+
+    Online: pip-audit y npm audit corren en paralelo y cada resultado se
+    cachea por `ttl` segundos, con clave el hash del lockfile (si no cambió,
+    no se vuelve a auditar); si la herramienta falta o no responde, no se
+    cachea. Con `advisory_db` (snapshot de `load_advisory_db`) se evalúan
+    las versiones fijadas offline, sin red ni cache.
+    """
+    req_file = project_path / "requirements.txt"
+    pkg_file = project_path / "package.json"
+    lock_file = project_path / "package-lock.json"
+
+    if advisory_db is not None:
+        findings = []
+        if req_file.exists():
+            findings += audit_offline(parse_requirements(req_file), advisory_db.get("pypi", {}), "requirements.txt")
+        if lock_file.exists():
+            findings += audit_offline(parse_package_lock(lock_file), advisory_db.get("npm", {}), "package-lock.json")
+        elif pkg_file.exists():
             findings.append({
-                "type": "pip-audit not available",
+                "type": "package-lock.json not found",
                 "severity": "INFO",
-                "recommendation": "Instalar: pip install pip-audit",
+                "recommendation": "El modo offline evalúa las versiones de package-lock.json (npm install --package-lock-only)",
             })
+        return findings
 
-    # Node: npm audit
-    pkg_file = project_path / "package.json"
+    audits = {}
+    if req_file.exists():
+        audits[f"pip:{lockfile_hash(req_file)}"] = lambda: audit_python(req_file)
     if pkg_file.exists():
+        audits[f"npm:{lockfile_hash(pkg_file, lock_file)}"] = lambda: audit_node(project_path)
+
+    cache_path = project_path / DEPS_CACHE_FILE
+    cache = {}
+    if use_cache:
         try:
-            result = subprocess.run(
-                ["npm", "audit", "--json"],
-                capture_output=True, text=True,
-                cwd=str(project_path), timeout=60
-            )
-            if result.returncode != 0:
-                try:
-                    audit_data = json.loads(result.stdout)
-                    vuln_count = audit_data.get("metadata", {}).get("vulnerabilities", {})
-                    findings.append({
-                        "type": "NPM dependency vulnerabilities",
-                        "high": vuln_count.get("high", 0),
-                        "critical": vuln_count.get("critical", 0),
-                        "severity": "HIGH" if vuln_count.get("critical", 0) > 0 else "MEDIUM",
-                    })
-                except json.JSONDecodeError:
-                    pass
-        except (FileNotFoundError, subprocess.TimeoutExpired):
+            cache = json.loads(cache_path.read_text())
+        except (OSError, ValueError):
             pass
+    now = time.time()
+    cache = {key: entry for key, entry in cache.items() if now - entry["time"] < ttl}
+
+    findings = []
+    pending = {key: audit for key, audit in audits.items() if key not in cache}
+    with ThreadPoolExecutor(max(1, len(pending))) as pool:
+        futures = {key: pool.submit(audit) for key, audit in pending.items()}
+    for key in audits:
+        if key in futures:
+            audit_findings, cacheable = futures[key].result()
+            findings.extend(audit_findings)
+            if cacheable:
+                cache[key] = {"time": now, "findings": audit_findings}
+        else:
+            findings.extend(cache[key]["findings"])
 
+    if use_cache and pending:
+        try:
+            write_cache(cache_path, cache)
+        except OSError:
+            pass
     return findings
 
 
-def print_report(all_findings: dict):
-    """Imprime el reporte de auditoría."""
+CHECKS = {
+    "secrets": "Secretos Hardcodeados",
+    "env": "Archivos .env",
+    "dependencies": "Dependencias Vulnerables",
+}
+
+
+def iter_findings(project_path: Path, args: argparse.Namespace, summary: dict) -> Iterator[tuple[str, dict]]:
+    """
+    Pipeline de todos los checks pedidos: genera (check, hallazgo) a medida
+    que aparecen y completa `summary` con la duración y la cantidad de
+    hallazgos de cada check (aunque se corte antes, ej. --fail-fast).
+    """
+    selected = [check for check in CHECKS if args.check in (check, "all")]
+    stats = ScanStats()
+    summary["checks"] = {}
+
+    # Un solo recorrido del árbol para todos los checks que lo necesitan
+    index = None
+    if "env" in selected or ("secrets" in selected and args.since_files is None):
+        index = WalkIndex(project_path)
+        summary["index"] = {"files": len(index.files), "pruned_dirs": index.pruned, "duration_s": round(index.duration, 3)}
+
+    producers = {
+        "secrets": lambda: iter_secrets(
+            project_path, args.since_files, use_cache=not args.no_cache, jobs=args.jobs,
+            max_file_size=args.max_file_size, max_line_length=args.max_line_length, index=index, stats=stats,
+        ),
+        "env": lambda: check_env_file(project_path, index),
+        "dependencies": lambda: check_dependencies(
+            project_path, use_cache=not args.no_cache, ttl=args.deps_ttl * 3600, advisory_db=args.advisory_db,
+        ),
+    }
+    for check in selected:
+        start = time.perf_counter()
+        count = 0
+        try:
+            for finding in producers[check]():
+                count += 1
+                yield check, finding
+        finally:
+            duration = time.perf_counter() - start
+            summary["checks"][check] = {"findings": count, "duration_s": round(duration, 3)}
+            if check == "secrets":
+                summary["checks"][check].update({
+                    "files": stats.files,
+                    "files_cached": stats.cached,
+                    "bytes_scanned": stats.bytes,
+                    "files_per_s": round(stats.files / duration, 1) if duration else 0.0,
+                    "bytes_per_s": round(stats.bytes / duration) if duration else 0,
+                })
+
+
+SARIF_LEVELS = {"HIGH": "error", "MEDIUM": "warning", "LOW": "note", "INFO": "note"}
+
+
+class JSONLWriter:
+    """Un JSON por línea: {"record": "finding", ...} por hallazgo y {"record": "summary", ...} al final."""
+
+    def __init__(self, out):
+        self.out = out
+
+    def finding(self, check: str, finding: dict):
+        self.out.write(json.dumps({"record": "finding", "check": check, **finding}) + "\n")
+        self.out.flush()
+
+    def close(self, summary: dict):
+        self.out.write(json.dumps({"record": "summary", **summary}) + "\n")
+        self.out.flush()
+
+
+class SarifWriter:
+    """
+    Documento SARIF 2.1.0 escrito de forma incremental: cada hallazgo es un
+    `result` apenas aparece y el resumen va en `invocations[0].properties`.
+    """
+
+    def __init__(self, out):
+        self.out = out
+        self.count = 0
+        header = {
+            "version": "2.1.0",
+            "$schema": "https://json.schemastore.org/sarif-2.1.0.json",
+            "runs": [{"tool": {"driver": {"name": "lmagent-audit-security"}}, "results": []}],
+        }
+        # Se abre el array de results y se cierra en close()
+        text = json.dumps(header)
+        self.out.write(text[: text.rindex("[]") + 1])
+        self.out.flush()
+
+    def finding(self, check: str, finding: dict):
+        message = finding.get("type", "Unknown")
+        if "recommendation" in finding:
+            message += f": {finding['recommendation']}"
+        result = {
+            "ruleId": f"{check}/{finding.get('type', 'Unknown').split(':')[0]}",
+            "level": SARIF_LEVELS.get(finding.get("severity", "INFO"), "note"),
+            "message": {"text": message},
+            "properties": {"severity": finding.get("severity", "INFO")},
+        }
+        if "file" in finding:
+            location = {"artifactLocation": {"uri": finding["file"].replace(os.sep, "/")}}
+            if "line" in finding:
+                location["region"] = {"startLine": finding["line"]}
+            result["locations"] = [{"physicalLocation": location}]
+        self.out.write(("," if self.count else "") + "\n" + json.dumps(result))
+        self.out.flush()
+        self.count += 1
+
+    def close(self, summary: dict):
+        invocation = {
+            "executionSuccessful": "error" not in summary,
+            "properties": summary,
+        }
+        if "error" in summary:
+            invocation["toolExecutionNotifications"] = [{"level": "error", "message": {"text": summary["error"]}}]
+        self.out.write("\n]," + json.dumps({"invocations": [invocation]})[1:-1] + "}]}\n")
+        self.out.flush()
+
+
+def print_report(all_findings: dict, timings: dict = None):
+    """Imprime el reporte de auditoría (y el tiempo de cada check, en segundos)."""
     print("\n" + "=" * 60)
     print("🛡️  SECURITY AUDIT REPORT")
     print("=" * 60)
@@ -198,6 +1121,12 @@ def print_report(all_findings: dict):
                 if "recommendation" in f:
                     print(f"     Fix: {f['recommendation']}")
 
+    if timings:
+        print(f"\n⏱️  Tiempos")
+        print("-" * 40)
+        for name, seconds in timings.items():
+            print(f"  {name:<32} {seconds:>8.2f}s")
+
     high_count = sum(1 for fs in all_findings.values() for f in fs if f.get("severity") == "HIGH")
     print(f"\n{'=' * 60}")
     print(f"Total: {total} hallazgos ({high_count} HIGH)")
@@ -215,27 +1144,104 @@ def main():
         default="all",
         help="Tipo de check"
     )
+    parser.add_argument(
+        "--since", default=None, metavar="GIT_REF",
+        help="Escanear secretos solo en los archivos modificados respecto de GIT_REF (ej. HEAD, origin/main)",
+    )
+    parser.add_argument("--jobs", "-j", type=int, default=None, help="Procesos para el escaneo (default: CPUs)")
+    parser.add_argument("--no-cache", action="store_true", help="Ignorar el cache de escaneos y auditorías anteriores")
+    parser.add_argument(
+        "--deps-ttl", type=float, default=DEPS_CACHE_TTL / 3600,
+        help="Horas que vale el resultado cacheado de pip-audit / npm audit para el mismo lockfile (default 24)",
+    )
+    parser.add_argument(
+        "--advisory-db", default=None, metavar="FILE",
+        help="Auditar dependencias offline contra un snapshot de advisories en JSON (sin red)",
+    )
+    parser.add_argument(
+        "--max-file-size", type=parse_size, default=MAX_FILE_SIZE,
+        help="Archivos más grandes no se escanean y se reportan como INFO (default 20MB)",
+    )
+    parser.add_argument(
+        "--max-line-length", type=parse_size, default=MAX_LINE_LENGTH,
+        help="Líneas más largas (minificados, fixtures en una línea) no se escanean (default 1MB)",
+    )
+    parser.add_argument(
+        "--format", "-f", choices=["text", "jsonl", "sarif"], default="text",
+        help="text: reporte al final; jsonl / sarif: hallazgos a stdout a medida que aparecen, más un resumen",
+    )
+    parser.add_argument("--fail-fast", action="store_true", help="Cortar el audit en el primer hallazgo HIGH")
 
     args = parser.parse_args()
     project_path = Path(args.path).resolve()
 
+    # En los formatos de máquina stdout es solo JSON: los errores van a stderr
+    err = sys.stdout if args.format == "text" else sys.stderr
     if not project_path.exists():
-        print(f"❌ Ruta no encontrada: {project_path}")
+        print(f"❌ Ruta no encontrada: {project_path}", file=err)
         sys.exit(1)
 
-    all_findings = {}
-
-    if args.check in ("secrets", "all"):
-        all_findings["Secretos Hardcodeados"] = scan_secrets(project_path)
+    args.since_files = None
+    if args.since and args.check in ("secrets", "all"):
+        try:
+            args.since_files = changed_files(project_path, args.since)
+        except (ValueError, FileNotFoundError) as e:
+            print(f"❌ --since {args.since}: {e}", file=err)
+            sys.exit(1)
+    if args.advisory_db and args.check in ("dependencies", "all"):
+        try:
+            args.advisory_db = load_advisory_db(args.advisory_db)
+        except (OSError, ValueError) as e:
+            print(f"❌ --advisory-db {args.advisory_db}: {e}", file=err)
+            sys.exit(1)
 
-    if args.check in ("env", "all"):
-        all_findings["Archivos .env"] = check_env_file(project_path)
+    writer = {"jsonl": JSONLWriter, "sarif": SarifWriter}.get(args.format)
+    writer = writer(sys.stdout) if writer else None
 
-    if args.check in ("dependencies", "all"):
-        all_findings["Dependencias Vulnerables"] = check_dependencies(project_path)
+    all_findings = {CHECKS[check]: [] for check in CHECKS if args.check in (check, "all")}
+    summary = {"path": str(project_path)}
+    high_count = 0
+    total = 0
+    start = time.perf_counter()
+    error = None
+    findings = iter_findings(project_path, args, summary)
+    try:
+        for check, finding in findings:
+            total += 1
+            if finding.get("severity") == "HIGH":
+                high_count += 1
+            if writer:
+                writer.finding(check, finding)
+            else:
+                all_findings[CHECKS[check]].append(finding)
+            if args.fail_fast and finding.get("severity") == "HIGH":
+                summary["stopped_early"] = True
+                break
+    except (OSError, ValueError) as e:
+        # El documento se cierra igual: sin resumen no sería JSON válido
+        error = summary["error"] = str(e)
+        print(f"❌ {e}", file=err)
+    finally:
+        findings.close()
 
-    high_count = print_report(all_findings)
-    sys.exit(1 if high_count > 0 else 0)
+    if writer:
+        summary.update({"findings": total, "high": high_count, "duration_s": round(time.perf_counter() - start, 3)})
+        writer.close(summary)
+    else:
+        timings = {}
+        if "index" in summary:
+            timings[f"Índice ({summary['index']['files']} archivos)"] = summary["index"]["duration_s"]
+        for check, result in summary["checks"].items():
+            timings[CHECKS[check]] = result["duration_s"]
+        # Mismo orden que antes del pipeline: por archivo y línea
+        for check_findings in all_findings.values():
+            check_findings.sort(key=lambda f: (f.get("file", ""), f.get("line", 0)))
+        if error:
+            sys.exit(1)
+        if summary.get("stopped_early"):
+            print("\n⛔ Audit cortado en el primer hallazgo HIGH (--fail-fast)")
+        print_report(all_findings, timings)
+    sys.exit(1 if high_count > 0 or error else 0)
 
 
 if __name__ == "__main__":
@@ -7,8 +7,25 @@ This is the main agent class that you can customize for your specific use case.
 from __future__ import annotations
 
 import asyncio
+import bisect
+import contextlib
+import contextvars
+import hashlib
+import heapq
+import importlib
+import itertools
+import json
+import os
+import random
+import secrets
+import sqlite3
+import time
+import uuid
+from collections import OrderedDict, deque
+from collections.abc import AsyncIterator, Callable, Iterable, Iterator, Mapping
 from pathlib import Path
-from typing import Any
+from types import SimpleNamespace
+from typing import Any, Protocol
 
 import yaml
 import structlog
@@ -24,6 +41,71 @@ from pydantic import BaseModel
 logger = structlog.get_logger()
 
 
+class CostLimitExceeded(Exception):
+    """The run (or the budget shared with other runs) spent its cost limit."""
+
+
+class ToolCall(BaseModel):
+    """A tool invocation requested by the LLM."""
+    id: str = ""
+    name: str
+    args: dict[str, Any] = {}
+
+
+class Usage(BaseModel):
+    """Token usage reported by the provider."""
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+
+class LLMResponse(BaseModel):
+    """An LLM response assembled from a stream of deltas."""
+    content: str = ""
+    thinking: str | None = None
+    tool_calls: list[ToolCall] = []
+    usage: Usage | None = None
+
+
+class HistoryPolicy(BaseModel):
+    """Compaction policy for the conversation history."""
+    max_context_ratio: float = 0.5
+    max_tool_result_chars: int = 4000
+    keep_recent: int = 6
+    summarize: bool = True
+    max_summary_chars: int = 4000
+    drop_superseded: bool = True
+    spill_dir: str | None = ".lmagent/trajectories"
+
+
+class CacheConfig(BaseModel):
+    """Response cache settings."""
+    enabled: bool = True
+    ttl_seconds: int = 86400
+    memory_max_entries: int = 1024
+    db_path: str | None = ".lmagent/cache/responses.sqlite"
+    db_max_mb: int = 100
+
+
+class RacingConfig(BaseModel):
+    """Speculative racing of a fast model against the configured one."""
+    enabled: bool = False
+    fast_provider: str | None = None
+    fast_model: str = "gpt-4o-mini"
+    accept_final_answers: bool = False
+
+
+class CheckpointConfig(BaseModel):
+    """Run checkpointing settings."""
+    dir: str | None = ".lmagent/checkpoints"
+    fsync: bool = True
+
+
+class TelemetryConfig(BaseModel):
+    """Span and metrics settings."""
+    max_spans: int = 10000
+    export_file: str | None = None
+
+
 class AgentConfig(BaseModel):
     """Configuration for the agent."""
     name: str
@@ -36,6 +118,12 @@ class AgentConfig(BaseModel):
     llm_model: str = "gpt-4o"
     temperature: float = 0.7
     max_tokens: int = 4096
+    max_retries: int = 3
+    retry_backoff_base: float = 1.0
+    retry_backoff_max: float = 60.0
+    context_window: int = 128000
+    models_file: str | None = None
+    racing: RacingConfig = RacingConfig()
     
     # Limits
     max_iterations: int = 10
@@ -44,27 +132,1103 @@ class AgentConfig(BaseModel):
     
     # Tools
     tools: list[str] = []
+    tool_registry: str | None = None
+    parallel_tool_calls: bool = True
+    max_concurrent_tools: int = 5
+    tool_concurrency: dict[str, int] = {}
+    cacheable_tools: list[str] = []
+    
+    # History
+    history: HistoryPolicy = HistoryPolicy()
+    
+    # Cache
+    cache: CacheConfig = CacheConfig()
+    
+    # Checkpoints
+    checkpoint: CheckpointConfig = CheckpointConfig()
+    
+    # Telemetry
+    telemetry: TelemetryConfig = TelemetryConfig()
     
     @classmethod
     def from_yaml(cls, path: str | Path) -> "AgentConfig":
         """Load config from YAML file."""
-        with open(path) as f:
-            data = yaml.safe_load(f)
+        data = _parse_yaml(Path(path))
+        
+        base_dir = Path(path).parent
+        llm_config = data.get("llm", {})
+        tools_config = data.get("tools", {})
+        concurrency = tools_config.get("concurrency", {})
+        from_registry = tools_config.get("from_registry", [])
+        
+        # Context window of the selected model, from the models registry
+        models_file = base_dir / llm_config.get("models_file", "../../config/models.yaml")
+        models = _load_yaml(models_file)
+        model_spec = (
+            models.get("providers", {})
+            .get(llm_config.get("provider", "openai"), {})
+            .get("models", {}) or {}
+        ).get(llm_config.get("model", "gpt-4o"), {})
+        
+        # Per-tool limits: registry defaults, overridden by the agent config
+        registry_file = base_dir / tools_config.get("registry", "../../config/tools.yaml")
+        registry = _load_yaml(registry_file)
+        tool_concurrency = {
+            name: spec["max_concurrency"]
+            for name, spec in registry.get("tools", {}).items()
+            if name in from_registry and "max_concurrency" in spec
+        }
+        tool_concurrency.update(concurrency.get("per_tool", {}))
         
         return cls(
             name=data["name"],
             display_name=data["display_name"],
             description=data["description"],
             version=data.get("version", "0.1.0"),
-            llm_provider=data.get("llm", {}).get("provider", "openai"),
-            llm_model=data.get("llm", {}).get("model", "gpt-4o"),
-            temperature=data.get("llm", {}).get("temperature", 0.7),
-            max_tokens=data.get("llm", {}).get("max_tokens", 4096),
+            llm_provider=llm_config.get("provider", "openai"),
+            llm_model=llm_config.get("model", "gpt-4o"),
+            temperature=llm_config.get("temperature", 0.7),
+            max_tokens=llm_config.get("max_tokens", 4096),
+            max_retries=llm_config.get("retry", {}).get("max_retries", 3),
+            retry_backoff_base=llm_config.get("retry", {}).get("backoff_base", 1.0),
+            retry_backoff_max=llm_config.get("retry", {}).get("backoff_max", 60.0),
+            context_window=model_spec.get("context_window", 128000),
+            models_file=str(models_file),
+            racing=RacingConfig(**llm_config.get("racing", {})),
             max_iterations=data.get("limits", {}).get("max_iterations", 10),
             max_cost=data.get("limits", {}).get("max_cost", 2.00),
             timeout_seconds=data.get("limits", {}).get("timeout_seconds", 300),
-            tools=data.get("tools", {}).get("from_registry", []),
+            tools=from_registry,
+            tool_registry=str(registry_file),
+            parallel_tool_calls=concurrency.get("parallel", True),
+            max_concurrent_tools=concurrency.get(
+                "max_concurrent",
+                registry.get("settings", {}).get("max_concurrent_tools", 5),
+            ),
+            tool_concurrency=tool_concurrency,
+            cacheable_tools=[
+                name for name, spec in registry.get("tools", {}).items()
+                if name in from_registry and spec.get("cacheable", False)
+            ],
+            history=HistoryPolicy(**data.get("history", {})),
+            cache=CacheConfig(**data.get("cache", {})),
+            checkpoint=CheckpointConfig(**data.get("checkpoint", {})),
+            telemetry=TelemetryConfig(**data.get("telemetry", {})),
+        )
+
+
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+_file_cache: dict[tuple[Path, str], tuple[tuple[int, int], Any]] = {}
+
+
+def _file_version(path: Path) -> tuple[int, int]:
+    stat = path.stat()
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _parse_yaml(path: Path) -> Any:
+    """
+    Parse a YAML file, memoized per process and invalidated by mtime.
+    
+    Callers must treat the returned data as read-only.
+    """
+    path = path.resolve()
+    version = _file_version(path)
+    cached = _file_cache.get((path, "yaml"))
+    if cached is None or cached[0] != version:
+        with open(path) as f:
+            cached = (version, yaml.load(f, Loader=_YAML_LOADER))
+        _file_cache[(path, "yaml")] = cached
+    return cached[1]
+
+
+def _read_text(path: Path) -> str:
+    """Read a text file, memoized per process and invalidated by mtime."""
+    path = path.resolve()
+    version = _file_version(path)
+    cached = _file_cache.get((path, "text"))
+    if cached is None or cached[0] != version:
+        cached = (version, path.read_text())
+        _file_cache[(path, "text")] = cached
+    return cached[1]
+
+
+def _load_yaml(path: Path) -> dict[str, Any]:
+    """Load a shared registry file (config/*.yaml) if it exists."""
+    if not path.exists():
+        return {}
+    return _parse_yaml(path) or {}
+
+
+class LazyToolRegistry(Mapping[str, Any]):
+    """
+    Tools resolved on first use.
+    
+    Only the registry specs (`module` and `class` from config/tools.yaml)
+    are held up front; a tool's module is imported and the tool created
+    the first time it is looked up, so agents that never call a tool never
+    pay for importing it.
+    """
+    
+    def __init__(self, specs: dict[str, dict[str, Any]]):
+        self._specs = dict(specs)
+        self._instances: dict[str, Any] = {}
+    
+    def __getitem__(self, name: str) -> Any:
+        if name not in self._instances:
+            spec = self._specs[name]
+            module = importlib.import_module(spec["module"])
+            self._instances[name] = getattr(module, spec["class"])()
+        return self._instances[name]
+    
+    def __contains__(self, name: object) -> bool:
+        # Membership must not import the tool
+        return name in self._specs
+    
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._specs)
+    
+    def __len__(self) -> int:
+        return len(self._specs)
+    
+    def register(self, name: str, tool: Any) -> None:
+        """Add an already-created tool (e.g. a custom one)."""
+        self._specs[name] = {}
+        self._instances[name] = tool
+
+
+class _ToolCallBuffer:
+    """Accumulates the streamed fragments of a single tool call."""
+    
+    def __init__(self):
+        self.id = ""
+        self.name = ""
+        self.arguments = ""
+        self.dispatched = False
+    
+    def feed(self, fragment: Any) -> ToolCall | None:
+        """Add a fragment; return the tool call once its arguments are complete."""
+        self.id = self.id or getattr(fragment, "id", None) or ""
+        self.name += getattr(fragment, "name", None) or ""
+        self.arguments += getattr(fragment, "arguments", None) or ""
+        
+        # A JSON object is only complete once its closing brace has arrived,
+        # so skip the parse attempt for every other fragment
+        if self.dispatched or not self.name or not self.arguments.rstrip().endswith("}"):
+            return None
+        try:
+            args = json.loads(self.arguments)
+        except json.JSONDecodeError:
+            return None
+        
+        self.dispatched = True
+        return ToolCall(id=self.id, name=self.name, args=args)
+
+
+def _ensure_private_dir(directory: Path) -> None:
+    """
+    Create a directory for run data (trajectories, checkpoints, caches).
+    
+    They hold full conversations and tool output, so a `.gitignore` that
+    ignores everything is written in the directory the first time.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    gitignore = directory / ".gitignore"
+    if not gitignore.exists():
+        gitignore.write_text("*\n")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), good enough for budgeting."""
+    return len(text) // 4 + 1
+
+
+class Message:
+    """Compact in-context representation of a history entry."""
+    
+    __slots__ = ("role", "content", "name", "args", "result", "tokens")
+    
+    def __init__(
+        self,
+        role: str,
+        content: str | None = None,
+        name: str | None = None,
+        args: dict[str, Any] | None = None,
+        result: Any = None
+    ):
+        self.role = role
+        self.content = content
+        self.name = name
+        self.args = args
+        self.result = result
+        self.tokens = estimate_tokens(
+            (content or "")
+            + (name or "")
+            + (json.dumps(args, default=str) if args is not None else "")
+            + (json.dumps(result, default=str) if result is not None else "")
+        )
+    
+    @classmethod
+    def from_dict(cls, data: dict[str, Any], max_result_chars: int) -> "Message":
+        """Build a message, truncating tool results larger than `max_result_chars`."""
+        result = data.get("result")
+        if result is not None:
+            serialized = json.dumps(result, default=str)
+            if len(serialized) > max_result_chars:
+                result = (
+                    f"{serialized[:max_result_chars]}... "
+                    f"[truncated {len(serialized) - max_result_chars} chars]"
+                )
+        
+        return cls(
+            role=data["role"],
+            content=data.get("content"),
+            name=data.get("name"),
+            args=data.get("args"),
+            result=result
+        )
+    
+    def to_dict(self) -> dict[str, Any]:
+        """Convert back to the dict format sent to the LLM."""
+        return {
+            slot: getattr(self, slot)
+            for slot in ("role", "content", "name", "args", "result")
+            if getattr(self, slot) is not None
+        }
+
+
+SUMMARY_NAME = "history_summary"
+
+
+def summarize_messages(messages: list[Message], max_chars: int = 4000) -> str:
+    """
+    Summarize old turns without an LLM call.
+    
+    Produces one line per message (earlier summaries are carried over) and
+    keeps the most recent lines that fit in `max_chars`.
+    """
+    lines: list[str] = []
+    for message in messages:
+        if message.name == SUMMARY_NAME:
+            lines.extend((message.content or "").splitlines()[1:])
+            continue
+        
+        text = message.content if message.content is not None else json.dumps(message.result, default=str)
+        label = f"{message.role}:{message.name}" if message.name else message.role
+        lines.append(f"- {label}: {' '.join(str(text).split())[:160]}")
+    
+    kept: list[str] = []
+    size = 0
+    for line in reversed(lines):
+        size += len(line) + 1
+        if size > max_chars:
+            break
+        kept.append(line)
+    
+    return "Summary of earlier conversation:\n" + "\n".join(reversed(kept))
+
+
+class ConversationHistory:
+    """
+    Token-aware conversation history with compaction.
+    
+    Keeps the in-context copy of the conversation within a token budget:
+    large tool results are truncated, repeated observations (same tool and
+    args) replace older ones, and old turns are summarized once the budget
+    is exceeded. Every message is also appended in full to a JSONL spill
+    file so the uncompacted trajectory can still be recovered.
+    """
+    
+    def __init__(
+        self,
+        budget_tokens: int,
+        policy: HistoryPolicy,
+        spill_path: Path | None = None,
+        summarizer: Callable[[list[Message], int], str] = summarize_messages
+    ):
+        self.budget_tokens = budget_tokens
+        self.policy = policy
+        self.spill_path = spill_path
+        self.summarizer = summarizer
+        self.messages: list[Message] = []
+        self.total_tokens = 0
+        self._spill_ready = False
+    
+    def __len__(self) -> int:
+        return len(self.messages)
+    
+    def append(self, message: dict[str, Any], spill: bool = True) -> None:
+        """
+        Add a message, compacting the history if it goes over budget.
+        
+        Pass `spill=False` when replaying messages already in the spill file.
+        """
+        if spill and self.spill_path is not None:
+            # Created on first write, so agents that never run leave no files
+            if not self._spill_ready:
+                _ensure_private_dir(self.spill_path.parent)
+                self._spill_ready = True
+            with open(self.spill_path, "a") as f:
+                f.write(json.dumps(message, default=str) + "\n")
+        
+        entry = Message.from_dict(message, self.policy.max_tool_result_chars)
+        if self.policy.drop_superseded and entry.role == "tool":
+            self._drop_superseded(entry)
+        
+        self.messages.append(entry)
+        self.total_tokens += entry.tokens
+        
+        if self.policy.summarize and self.total_tokens > self.budget_tokens:
+            self._summarize_old_turns()
+    
+    def to_messages(self) -> list[dict[str, Any]]:
+        """Get the compacted history, as sent to the LLM."""
+        return [message.to_dict() for message in self.messages]
+    
+    def full_record(self) -> list[dict[str, Any]]:
+        """Get every message ever appended, read back from the spill file."""
+        if self.spill_path is None or not self.spill_path.exists():
+            return self.to_messages()
+        with open(self.spill_path) as f:
+            return [json.loads(line) for line in f]
+    
+    def _drop_superseded(self, entry: Message) -> None:
+        """Remove older observations of the same tool call."""
+        kept = []
+        for message in self.messages:
+            if message.role == "tool" and message.name == entry.name and message.args == entry.args:
+                self.total_tokens -= message.tokens
+            else:
+                kept.append(message)
+        self.messages = kept
+    
+    def _summarize_old_turns(self) -> None:
+        """Replace the oldest turns with a summary until back under budget."""
+        # The original task and the most recent turns are never summarized
+        start = 1 if self.messages and self.messages[0].role == "user" else 0
+        end = len(self.messages) - self.policy.keep_recent
+        
+        excess = self.total_tokens - self.budget_tokens
+        cut, freed = start, 0
+        while cut < end and freed < excess:
+            freed += self.messages[cut].tokens
+            cut += 1
+        if cut - start < 2:
+            return
+        
+        summary = Message(
+            role="system",
+            name=SUMMARY_NAME,
+            content=self.summarizer(self.messages[start:cut], self.policy.max_summary_chars)
+        )
+        self.messages[start:cut] = [summary]
+        self.total_tokens += summary.tokens - freed
+        
+        logger.info(
+            "history_compacted",
+            summarized=cut - start,
+            tokens=self.total_tokens,
+            budget=self.budget_tokens
+        )
+
+
+
+class RunCheckpoint:
+    """
+    Append-only on-disk log of an agent run.
+    
+    One JSON line is written when the run starts, after every completed
+    step (the messages it added to the history and the cost so far), after
+    an interrupted step (no messages, only the cost it spent) and when the
+    run finishes. A run interrupted by a timeout or a restart can
+    be rebuilt from the log without repeating completed steps; a line left
+    half-written by a crash is ignored.
+    """
+    
+    def __init__(self, path: Path, fsync: bool = True):
+        self.path = path
+        self.fsync = fsync
+        self._ready = False
+    
+    def start(self, user_input: str, context: dict[str, Any] | None) -> None:
+        self._write({"type": "start", "input": user_input, "context": context})
+    
+    def step(self, iteration: int, messages: list[dict[str, Any]], total_cost: float) -> None:
+        self._write({
+            "type": "step",
+            "iteration": iteration,
+            "messages": messages,
+            "total_cost": total_cost
+        })
+    
+    def finish(self, response: str, total_cost: float) -> None:
+        self._write({"type": "finish", "response": response, "total_cost": total_cost})
+    
+    def load(self) -> dict[str, Any]:
+        """
+        Read the log back into the state of the run.
+        
+        Returns:
+            The original `input` and `context`, the `messages` of every
+            completed step, the last completed `iteration`, `total_cost`, and
+            the final `response` (None if the run did not finish).
+        """
+        state: dict[str, Any] = {
+            "input": None,
+            "context": None,
+            "messages": [],
+            "iteration": 0,
+            "total_cost": 0.0,
+            "response": None,
+        }
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                
+                if record["type"] == "start":
+                    # A log appended to by another run: only the last one counts
+                    state.update(
+                        input=record["input"],
+                        context=record["context"],
+                        messages=[],
+                        iteration=0,
+                        total_cost=0.0,
+                        response=None
+                    )
+                elif record["type"] == "step":
+                    state["messages"].extend(record["messages"])
+                    state["iteration"] = record["iteration"]
+                    state["total_cost"] = record["total_cost"]
+                elif record["type"] == "finish":
+                    state["response"] = record["response"]
+                    state["total_cost"] = record["total_cost"]
+        return state
+    
+    def _write(self, record: dict[str, Any]) -> None:
+        if not self._ready:
+            _ensure_private_dir(self.path.parent)
+            self._ready = True
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record, default=str) + "\n")
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+class CacheTier(Protocol):
+    """A storage tier of the response cache."""
+    
+    def get(self, key: str) -> Any | None: ...
+    
+    def set(self, key: str, value: Any) -> None: ...
+
+
+class MemoryCache:
+    """In-process LRU cache tier with TTL."""
+    
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+    
+    def get(self, key: str) -> Any | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        
+        expires_at, value = entry
+        if expires_at < time.time():
+            del self._entries[key]
+            return None
+        
+        self._entries.move_to_end(key)
+        return value
+    
+    def set(self, key: str, value: Any) -> None:
+        self._entries[key] = (time.time() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class SQLiteCache:
+    """
+    On-disk cache tier with TTL and a size limit.
+    
+    Shared by every agent process that points at the same file, which is
+    what makes repeated CI/eval runs hit the cache. Least recently used
+    entries are evicted once the stored values exceed `max_bytes`.
+    """
+    
+    def __init__(self, path: Path, ttl_seconds: float, max_bytes: int):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._conn: sqlite3.Connection | None = None
+        self._size = 0
+    
+    @property
+    def _db(self) -> sqlite3.Connection:
+        """Connection opened on first use, keeping agent startup cheap."""
+        if self._conn is None:
+            _ensure_private_dir(self.path.parent)
+            self._conn = sqlite3.connect(self.path, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        return self._conn
+    
+    def get(self, key: str) -> Any | None:
+        if self._conn is None and not self.path.exists():
+            return None
+        row = self._db.execute(
+            "SELECT value, expires_at, size FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        
+        now = time.time()
+        if row[1] < now:
+            self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._size -= row[2]
+            return None
+        
+        self._db.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+    
+    def set(self, key: str, value: Any) -> None:
+        data = json.dumps(value, default=str)
+        now = time.time()
+        replaced = self._db.execute("SELECT size FROM cache WHERE key = ?", (key,)).fetchone()
+        self._db.execute(
+            "INSERT OR REPLACE INTO cache (key, value, size, expires_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, data, len(data), now + self.ttl_seconds, now)
+        )
+        self._size += len(data) - (replaced[0] if replaced else 0)
+        if self._size > self.max_bytes:
+            self._evict(now)
+    
+    def _evict(self, now: float) -> None:
+        """Drop expired entries, then least recently used ones, until under the limit."""
+        self._db.execute("DELETE FROM cache WHERE expires_at < ?", (now,))
+        self._size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        
+        excess = self._size - self.max_bytes
+        if excess <= 0:
+            return
+        
+        stale = []
+        for key, size in self._db.execute("SELECT key, size FROM cache ORDER BY accessed_at"):
+            stale.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self._db.executemany("DELETE FROM cache WHERE key = ?", stale)
+        self._size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+
+
+class ResponseCache:
+    """
+    Tiered cache for LLM responses and tool results.
+    
+    Lookups go through the tiers in order (fastest first) and hits are
+    promoted to the faster tiers. Any object implementing `CacheTier` can
+    be added, e.g. a Redis-backed tier shared across hosts.
+    """
+    
+    def __init__(self, tiers: list[CacheTier]):
+        self.tiers = tiers
+        self.hits = 0
+        self.misses = 0
+    
+    @classmethod
+    def from_config(cls, config: CacheConfig) -> "ResponseCache":
+        """Build the in-memory LRU + SQLite tiers described by `config`."""
+        tiers: list[CacheTier] = [MemoryCache(config.memory_max_entries, config.ttl_seconds)]
+        if config.db_path:
+            tiers.append(SQLiteCache(
+                Path(config.db_path),
+                ttl_seconds=config.ttl_seconds,
+                max_bytes=config.db_max_mb * 1024 * 1024
+            ))
+        return cls(tiers)
+    
+    @staticmethod
+    def make_key(namespace: str, payload: Any) -> str:
+        """Stable key for a request: a hash of its canonical JSON form."""
+        data = json.dumps(payload, sort_keys=True, default=str)
+        return f"{namespace}:{hashlib.sha256(data.encode()).hexdigest()}"
+    
+    def get(self, key: str) -> Any | None:
+        for i, tier in enumerate(self.tiers):
+            value = tier.get(key)
+            if value is not None:
+                for faster in self.tiers[:i]:
+                    faster.set(key, value)
+                self.hits += 1
+                return value
+        
+        self.misses += 1
+        return None
+    
+    def set(self, key: str, value: Any) -> None:
+        for tier in self.tiers:
+            tier.set(key, value)
+    
+    def stats(self) -> dict[str, Any]:
+        """Hit/miss counters since the cache was created."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class TokenBucket:
+    """Continuously refilled token bucket holding up to one minute of quota."""
+    
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+    
+    def delay(self, amount: float, rate_scale: float, now: float) -> float:
+        """Seconds until `amount` is available at the (scaled) refill rate."""
+        rate = self.capacity * rate_scale / 60
+        self.level = min(self.capacity, self.level + (now - self.updated) * rate)
+        self.updated = now
+        
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / rate
+    
+    def take(self, amount: float) -> None:
+        self.level -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """
+    Request and token rate limiter for one model, shared by all agents.
+    
+    Two token buckets (requests/min and tokens/min) meter calls at the
+    provider quota. Waiters are served by priority, then arrival order, so
+    steps of runs already in progress go ahead of new runs. A throttling
+    response pauses the whole queue for its Retry-After and halves the
+    effective rate, which then recovers gradually on successful calls.
+    """
+    
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.rate_scale = 1.0
+        self._paused_until = 0.0
+        self._waiters: list[tuple[int, int]] = []
+        self._counter = itertools.count()
+        self._cond = asyncio.Condition()
+        
+        # Metrics
+        self.acquired = 0
+        self.throttled = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+    
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+    
+    async def acquire(self, tokens: int, priority: int = 1) -> float:
+        """
+        Wait until a request of `tokens` tokens fits in the quota.
+        
+        Args:
+            tokens: Estimated tokens of the request (prompt + max output).
+            priority: Lower values are served first.
+        
+        Returns:
+            Seconds spent waiting.
+        """
+        start = time.monotonic()
+        key = (priority, next(self._counter))
+        
+        async with self._cond:
+            heapq.heappush(self._waiters, key)
+            # A higher-priority arrival may take over the head of the queue
+            self._cond.notify_all()
+            try:
+                while True:
+                    if self._waiters[0] == key:
+                        delay = self._reserve(tokens)
+                        if delay <= 0:
+                            break
+                        with contextlib.suppress(asyncio.TimeoutError):
+                            await asyncio.wait_for(self._cond.wait(), delay)
+                    else:
+                        await self._cond.wait()
+            finally:
+                self._waiters.remove(key)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+        
+        waited = time.monotonic() - start
+        self.acquired += 1
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        return waited
+    
+    def _reserve(self, tokens: int) -> float:
+        """Take quota for one request, or return how long to wait for it."""
+        now = time.monotonic()
+        if now < self._paused_until:
+            return self._paused_until - now
+        
+        delay = max(
+            self.requests.delay(1, self.rate_scale, now),
+            self.tokens.delay(tokens, self.rate_scale, now)
         )
+        if delay <= 0:
+            self.requests.take(1)
+            self.tokens.take(tokens)
+        return delay
+    
+    async def settle(self, reserved: int, used: int) -> None:
+        """
+        Reconcile a request's reservation with the tokens it actually used.
+        
+        `acquire` reserves the prompt plus the full `max_tokens`; most
+        responses are far shorter, so the unused part is credited back
+        (or an overrun taken) once the provider reports usage.
+        """
+        async with self._cond:
+            bucket = self.tokens
+            bucket.level = min(bucket.capacity, bucket.level + min(reserved, bucket.capacity) - used)
+            self._cond.notify_all()
+    
+    def on_success(self) -> None:
+        """Recover the effective rate additively after a successful call."""
+        self.rate_scale = min(1.0, self.rate_scale + 0.05)
+    
+    def on_throttle(self, retry_after: float | None) -> None:
+        """Back off after a throttling (429) response."""
+        self.throttled += 1
+        self.rate_scale = max(0.1, self.rate_scale * 0.5)
+        if retry_after:
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+    
+    def stats(self) -> dict[str, Any]:
+        """Queue depth and wait time metrics."""
+        return {
+            "queue_depth": self.queue_depth,
+            "acquired": self.acquired,
+            "throttled": self.throttled,
+            "rate_scale": round(self.rate_scale, 2),
+            "wait_seconds_total": round(self.wait_seconds_total, 3),
+            "wait_seconds_max": round(self.wait_seconds_max, 3),
+            "wait_seconds_mean": round(self.wait_seconds_total / self.acquired, 3) if self.acquired else 0.0,
+        }
+
+
+def is_rate_limited(error: Exception) -> bool:
+    """Whether `error` is a provider throttling response (HTTP 429)."""
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status == 429 or type(error).__name__ == "RateLimitError"
+
+
+def retry_after_seconds(error: Exception) -> float | None:
+    """Read the Retry-After header (in seconds) from a provider error, if any."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+LATENCY_BUCKETS_MS = (
+    1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 120000,
+)
+TOKEN_BUCKETS = (16, 64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+COUNT_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+class Histogram:
+    """Fixed-bucket histogram with percentile estimates (Prometheus style)."""
+    
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+    
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+    
+    def percentile(self, q: float) -> float:
+        """Estimate the `q` quantile (0-1) by interpolating inside its bucket."""
+        if not self.count:
+            return 0.0
+        
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else self.min
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                estimate = lower + (upper - lower) * (rank - seen) / count
+                return min(max(estimate, self.min), self.max)
+            seen += count
+        return self.max
+    
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 3),
+            "min": round(self.min, 3) if self.count else 0.0,
+            "max": round(self.max, 3) if self.count else 0.0,
+            "mean": round(self.sum / self.count, 3) if self.count else 0.0,
+            "p50": round(self.percentile(0.50), 3),
+            "p95": round(self.percentile(0.95), 3),
+            "p99": round(self.percentile(0.99), 3),
+        }
+
+
+class MetricsRegistry:
+    """
+    In-process registry of histograms, keyed by name and labels.
+    
+    Example:
+        >>> agent.metrics.histogram("tool_latency_ms", tool="http_request").percentile(0.95)
+    """
+    
+    def __init__(self):
+        self._histograms: dict[str, Histogram] = {}
+    
+    def histogram(
+        self,
+        name: str,
+        buckets: tuple[float, ...] = LATENCY_BUCKETS_MS,
+        **labels: Any
+    ) -> Histogram:
+        """Get or create the histogram for `name` and `labels`."""
+        key = name
+        if labels:
+            key += "{" + ",".join(f"{k}={v}" for k, v in sorted(labels.items())) + "}"
+        if key not in self._histograms:
+            self._histograms[key] = Histogram(buckets)
+        return self._histograms[key]
+    
+    def observe(
+        self,
+        name: str,
+        value: float,
+        buckets: tuple[float, ...] = LATENCY_BUCKETS_MS,
+        **labels: Any
+    ) -> None:
+        self.histogram(name, buckets, **labels).observe(value)
+    
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        return {key: histogram.snapshot() for key, histogram in sorted(self._histograms.items())}
+
+
+_current_span: contextvars.ContextVar[Span | None] = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """A timed unit of work, exported in the OpenTelemetry span layout."""
+    
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+    
+    def __init__(self, name: str, parent: Span | None, attributes: dict[str, Any]):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.start_ns = time.time_ns()
+        self.end_ns: int | None = None
+        self.attributes = attributes
+        self.error: str | None = None
+    
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+    
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_id,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "duration_ms": round(((self.end_ns or time.time_ns()) - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "status": {"code": "ERROR", "message": self.error} if self.error else {"code": "OK"},
+        }
+
+
+class Tracer:
+    """
+    Records nested spans for the agent loop.
+    
+    The parent span is tracked in a context variable, so spans opened in
+    tasks (e.g. concurrent tool calls) attach to the span that created
+    them. Finished spans are kept in memory (bounded) and passed to the
+    optional `exporter`, e.g. a bridge to an OTLP exporter.
+    """
+    
+    def __init__(self, max_spans: int = 10000, exporter: Callable[[dict[str, Any]], None] | None = None):
+        self.spans: deque[dict[str, Any]] = deque(maxlen=max_spans)
+        self.exporter = exporter
+    
+    @staticmethod
+    def current() -> Span | None:
+        """The innermost open span of the running task."""
+        return _current_span.get()
+    
+    @contextlib.contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        span = Span(name, _current_span.get(), attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = repr(e)
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            _current_span.reset(token)
+            
+            record = span.to_dict()
+            self.spans.append(record)
+            if self.exporter is not None:
+                self.exporter(record)
+
+
+def jsonl_exporter(path: str | Path) -> Callable[[dict[str, Any]], None]:
+    """Span exporter that appends each finished span to a JSONL file."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    
+    def export(record: dict[str, Any]) -> None:
+        with open(path, "a") as f:
+            f.write(json.dumps(record, default=str) + "\n")
+    
+    return export
+
+
+class CostBudget:
+    """
+    Cost limit shared by several agents (e.g. the tasks of an `AgentPool`).
+    
+    Every agent charges its LLM spend here as it happens, so concurrent
+    runs stop making requests once the budget is spent between them.
+    """
+    
+    def __init__(self, max_cost: float | None = None):
+        self.max_cost = max_cost
+        self.spent = 0.0
+    
+    @property
+    def exhausted(self) -> bool:
+        return self.max_cost is not None and self.spent >= self.max_cost
+    
+    def charge(self, cost: float) -> None:
+        self.spent += cost
+
+
+def _elapsed_ms(start: float) -> float:
+    return (time.perf_counter() - start) * 1000
+
+
+class ProviderPool:
+    """
+    Per-provider resources shared by every agent in the process.
+    
+    Holds one HTTP connection pool and one concurrency limiter per provider,
+    and one rate limiter per model, sized from `config/models.yaml`, so
+    concurrent agents reuse connections and respect provider limits together.
+    """
+    
+    def __init__(self, providers: dict[str, Any], limits: dict[str, Any]):
+        self.providers = providers
+        self.max_concurrent = limits.get("max_concurrent_requests", 5)
+        self.requests_per_minute = limits.get("max_requests_per_minute", 60)
+        self.tokens_per_minute = limits.get("max_tokens_per_minute", 200000)
+        self._clients: dict[str, Any] = {}
+        self._limiters: dict[str, asyncio.Semaphore] = {}
+        self._rate_limiters: dict[str, RateLimiter] = {}
+    
+    @classmethod
+    def from_yaml(cls, path: str | Path | None) -> "ProviderPool":
+        """Create the pool from the models registry (config/models.yaml)."""
+        data = _load_yaml(Path(path)) if path else {}
+        return cls(data.get("providers", {}), data.get("limits", {}))
+    
+    def client(self, provider: str) -> Any:
+        """Get the shared HTTP client for `provider`, created on first use."""
+        if provider not in self._clients:
+            import httpx  # Installed with the provider SDKs
+            
+            self._clients[provider] = httpx.AsyncClient(
+                base_url=self.providers.get(provider, {}).get("api_base", ""),
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrent,
+                    max_keepalive_connections=self.max_concurrent
+                )
+            )
+        return self._clients[provider]
+    
+    def limiter(self, provider: str) -> asyncio.Semaphore:
+        """Get the limiter bounding in-flight requests to `provider`."""
+        if provider not in self._limiters:
+            self._limiters[provider] = asyncio.Semaphore(self.max_concurrent)
+        return self._limiters[provider]
+    
+    def rate_limiter(self, provider: str, model: str) -> RateLimiter:
+        """Get the rate limiter for `model`, using its `rate_limits` if declared."""
+        key = f"{provider}/{model}"
+        if key not in self._rate_limiters:
+            models = self.providers.get(provider, {}).get("models") or {}
+            rate_limits = models.get(model, {}).get("rate_limits", {})
+            self._rate_limiters[key] = RateLimiter(
+                requests_per_minute=rate_limits.get("requests_per_minute", self.requests_per_minute),
+                tokens_per_minute=rate_limits.get("tokens_per_minute", self.tokens_per_minute)
+            )
+        return self._rate_limiters[key]
+    
+    def cost(self, provider: str, model: str, usage: Usage) -> float:
+        """Cost in USD of `usage` on `model`, from its `cost_per_1k_*` prices."""
+        models = self.providers.get(provider, {}).get("models") or {}
+        spec = models.get(model, {})
+        return (
+            usage.input_tokens * spec.get("cost_per_1k_input", 0.0)
+            + usage.output_tokens * spec.get("cost_per_1k_output", 0.0)
+        ) / 1000
+    
+    def stats(self) -> dict[str, dict[str, Any]]:
+        """Rate limiter metrics per model."""
+        return {key: limiter.stats() for key, limiter in self._rate_limiters.items()}
+    
+    async def aclose(self) -> None:
+        """Close every HTTP client opened by the pool."""
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+
+
+def tool_semaphores(config: AgentConfig) -> dict[str, asyncio.Semaphore]:
+    """Per-tool concurrency limits (`max_concurrency` in config/tools.yaml)."""
+    return {name: asyncio.Semaphore(limit) for name, limit in config.tool_concurrency.items()}
 
 
 class MyAgent:
@@ -79,12 +1243,33 @@ class MyAgent:
         >>> print(result)
     """
     
-    def __init__(self, config: AgentConfig):
-        """Initialize the agent with configuration."""
+    def __init__(
+        self,
+        config: AgentConfig,
+        providers: ProviderPool | None = None,
+        cache: ResponseCache | None = None,
+        metrics: MetricsRegistry | None = None,
+        tool_limits: dict[str, asyncio.Semaphore] | None = None,
+        budget: CostBudget | None = None
+    ):
+        """
+        Initialize the agent with configuration.
+        
+        Args:
+            config: The agent configuration.
+            providers: Provider connection pools and limiters to share with
+                other agents. A private pool is created if omitted.
+            cache: Response cache to share with other agents. A private one
+                is created from `config.cache` if omitted.
+            metrics: Metrics registry to share with other agents. A private
+                one is created if omitted.
+            tool_limits: Per-tool concurrency limits to share with other
+                agents. Created from `config.tool_concurrency` if omitted.
+            budget: Cost budget shared with other agents, checked along
+                with `config.max_cost` before every LLM request.
+        """
         self.config = config
-        self.history: list[dict[str, Any]] = []
-        self.iteration_count = 0
-        self.total_cost = 0.0
+        self._start_run(uuid.uuid4().hex)
         
         # Load system prompt
         self.system_prompt = self._load_system_prompt()
@@ -92,12 +1277,34 @@ class MyAgent:
         # Initialize tools
         self.tools = self._load_tools()
         
+        # Concurrency limits for tool execution (global + per tool)
+        self._tool_semaphore = asyncio.Semaphore(
+            config.max_concurrent_tools if config.parallel_tool_calls else 1
+        )
+        self._tool_semaphores = tool_limits if tool_limits is not None else tool_semaphores(config)
+        self.budget = budget
+        
+        # Response cache for deterministic LLM calls (tool results are
+        # cached per run, see `_start_run`)
+        if cache is None and config.cache.enabled:
+            cache = ResponseCache.from_config(config.cache)
+        self.cache = cache
+        
         # Initialize LLM provider
-        # self.llm = get_provider(config.llm_provider, config.llm_model)
+        self.providers = providers or ProviderPool.from_yaml(config.models_file)
+        # self.llm = get_provider(
+        #     config.llm_provider,
+        #     config.llm_model,
+        #     http_client=self.providers.client(config.llm_provider)
+        # )
         
         # Initialize tracking
+        self.metrics = metrics or MetricsRegistry()
+        self.tracer = Tracer(
+            max_spans=config.telemetry.max_spans,
+            exporter=jsonl_exporter(config.telemetry.export_file) if config.telemetry.export_file else None
+        )
         # self.trajectory = TrajectoryLogger()
-        # self.cost_tracker = CostTracker(max_cost=config.max_cost)
         
         logger.info(
             "agent_initialized",
@@ -112,24 +1319,52 @@ class MyAgent:
         config = AgentConfig.from_yaml(config_path)
         return cls(config)
     
+    def _start_run(self, run_id: str) -> None:
+        """Reset the per-run state (history, counters, checkpoint) for `run_id`."""
+        self.run_id = run_id
+        self.history = ConversationHistory(
+            budget_tokens=int(self.config.context_window * self.config.history.max_context_ratio),
+            policy=self.config.history,
+            spill_path=(
+                Path(self.config.history.spill_dir) / f"{run_id}.jsonl"
+                if self.config.history.spill_dir else None
+            )
+        )
+        self.iteration_count = 0
+        self.total_cost = 0.0
+        self.checkpoint = (
+            RunCheckpoint(Path(self.config.checkpoint.dir) / f"{run_id}.jsonl", self.config.checkpoint.fsync)
+            if self.config.checkpoint.dir else None
+        )
+        
+        # Results of idempotent tools are only reused within the run, in
+        # memory: files and schemas may change between runs. Tools with side
+        # effects bump the epoch, which is part of the tool cache key, so
+        # later reads never see results cached before a write.
+        self.tool_cache = (
+            ResponseCache([MemoryCache(self.config.cache.memory_max_entries, self.config.cache.ttl_seconds)])
+            if self.config.cache.enabled else None
+        )
+        self._tool_cache_epoch = 0
+    
     def _load_system_prompt(self) -> str:
         """Load system prompt from file."""
         prompt_path = Path(__file__).parent / "prompts" / "system.md"
         if prompt_path.exists():
-            return prompt_path.read_text()
+            return _read_text(prompt_path)
         return "You are a helpful AI assistant."
     
-    def _load_tools(self) -> dict[str, Any]:
-        """Load and initialize tools."""
-        tools = {}
-        
-        # Load tools from registry
-        # for tool_name in self.config.tools:
-        #     tools[tool_name] = ToolRegistry.get(tool_name)
+    def _load_tools(self) -> LazyToolRegistry:
+        """Load tools lazily: each is imported on its first call."""
+        registry = _load_yaml(Path(self.config.tool_registry)) if self.config.tool_registry else {}
+        specs = registry.get("tools", {})
+        tools = LazyToolRegistry({
+            name: specs[name] for name in self.config.tools if name in specs
+        })
         
         # Load custom tools
         # from .tools import custom_tool
-        # tools["custom_tool"] = custom_tool.CustomTool()
+        # tools.register("custom_tool", custom_tool.CustomTool())
         
         return tools
     
@@ -141,6 +1376,9 @@ class MyAgent:
         """
         Run the agent with user input.
         
+        Every call is a new run with its own `run_id`, history, cost and
+        checkpoint; `self.run_id` is the one to pass to `resume`.
+        
         Args:
             user_input: The user's query or task.
             context: Optional additional context.
@@ -152,84 +1390,698 @@ class MyAgent:
             CostLimitExceeded: If the cost limit is reached.
             MaxIterationsExceeded: If max iterations is reached.
         """
+        self._start_run(uuid.uuid4().hex)
+        return await self._run(user_input, context)
+    
+    async def resume(self, run_id: str) -> str:
+        """
+        Resume an interrupted run from its checkpoint.
+        
+        The history, iteration count and cost are rebuilt from the run's
+        checkpoint log, and the loop continues after the last completed
+        step, so the LLM and tool calls of completed steps are not repeated.
+        If the run had already finished, its final response is returned.
+        
+        Example:
+            >>> agent = MyAgent.from_config("config.yaml")
+            >>> result = await agent.resume("3f2a...")
+        
+        Raises:
+            FileNotFoundError: If there is no checkpoint for `run_id`.
+        """
+        if not self.config.checkpoint.dir:
+            raise FileNotFoundError("Checkpointing is disabled (checkpoint.dir is null)")
+        
+        self._start_run(run_id)
+        state = self.checkpoint.load()
+        for message in state["messages"]:
+            # Already recorded in the trajectory by the original run
+            self.history.append(message, spill=False)
+        self.iteration_count = state["iteration"]
+        self.total_cost = state["total_cost"]
+        
+        logger.info(
+            "agent_run_resumed",
+            run_id=run_id,
+            iterations=self.iteration_count,
+            messages=len(state["messages"]),
+            finished=state["response"] is not None
+        )
+        if state["response"] is not None:
+            return state["response"]
+        return await self._run(
+            state["input"], state["context"], start_iteration=self.iteration_count, resumed=True
+        )
+    
+    async def run_stream(
+        self,
+        user_input: str,
+        context: dict[str, Any] | None = None
+    ) -> AsyncIterator[str]:
+        """
+        Run the agent, yielding response content as it is generated.
+        
+        The LLM response is streamed, and each tool call starts executing as
+        soon as its arguments are complete instead of after the whole message.
+        Closing the generator early cancels the run.
+        
+        Example:
+            >>> async for chunk in agent.run_stream("Your input here"):
+            ...     print(chunk, end="", flush=True)
+        """
+        self._start_run(uuid.uuid4().hex)
+        chunks: asyncio.Queue[str | None] = asyncio.Queue()
+        task = asyncio.create_task(
+            self._run(user_input, context, on_delta=chunks.put_nowait)
+        )
+        task.add_done_callback(lambda _: chunks.put_nowait(None))
+        
+        try:
+            while (chunk := await chunks.get()) is not None:
+                yield chunk
+            
+            # Propagate errors raised by the run
+            await task
+        finally:
+            # Consumer stopped early: cancel the run and its in-flight tools
+            if not task.done():
+                task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await task
+    
+    async def _run(
+        self,
+        user_input: str,
+        context: dict[str, Any] | None = None,
+        on_delta: Callable[[str], None] | None = None,
+        start_iteration: int = 0,
+        resumed: bool = False
+    ) -> str:
+        """
+        Main agent loop. Streams the LLM response when `on_delta` is given.
+        
+        A resumed run passes `resumed=True` and the number of steps already
+        completed as `start_iteration` (0 if it stopped during the first
+        step); its history is already in place.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.config.timeout_seconds
+        
         logger.info(
             "agent_run_start",
             input_length=len(user_input),
-            context_keys=list(context.keys()) if context else []
+            context_keys=list(context.keys()) if context else [],
+            stream=on_delta is not None
         )
         
-        # Add user message to history
-        self.history.append({
-            "role": "user",
-            "content": user_input
-        })
+        if not resumed:
+            # Add user message to history
+            message = {"role": "user", "content": user_input}
+            self.history.append(message)
+            if self.checkpoint is not None:
+                self.checkpoint.start(user_input, context)
+                self.checkpoint.step(0, [message], self.total_cost)
         
-        # Main agent loop
-        for iteration in range(self.config.max_iterations):
-            self.iteration_count = iteration + 1
-            
-            logger.info(f"🤠 INFO ========================= STEP {iteration + 1} =========================")
-            
-            # Get LLM response
-            # response = await self.llm.complete(
-            #     system_prompt=self.system_prompt,
-            #     messages=self.history,
-            #     tools=self.tools,
-            #     temperature=self.config.temperature,
-            #     max_tokens=self.config.max_tokens
-            # )
-            
-            # For template purposes, simulate a response
-            response = await self._simulate_response(user_input, iteration)
-            
-            # Track cost
-            # self.cost_tracker.track(
-            #     model=self.config.llm_model,
-            #     input_tokens=response.usage.input_tokens,
-            #     output_tokens=response.usage.output_tokens
-            # )
-            
-            # Log thinking
-            if hasattr(response, 'thinking'):
-                logger.info(f"💭 THOUGHT: {response.thinking}")
-            
-            # If there are tool calls, execute them
-            if hasattr(response, 'tool_calls') and response.tool_calls:
-                for tool_call in response.tool_calls:
-                    logger.info(f"🎬 ACTION: {tool_call.name}({tool_call.args})")
-                    
-                    # Execute tool
-                    # result = await self.tools[tool_call.name].execute(**tool_call.args)
-                    result = {"success": True, "data": "Simulated result"}
-                    
-                    logger.info(f"📤 OBSERVATION: {str(result)[:200]}...")
-                    
-                    # Add to history
-                    self.history.append({
-                        "role": "tool",
-                        "name": tool_call.name,
-                        "result": result
-                    })
-            else:
-                # No tool calls, agent wants to respond
-                final_response = response.content if hasattr(response, 'content') else str(response)
+        with self.tracer.span(
+            "agent.run",
+            run_id=self.run_id,
+            model=self.config.llm_model,
+            stream=on_delta is not None
+        ) as run_span:
+            # Main agent loop
+            for iteration in range(start_iteration, self.config.max_iterations):
+                self.iteration_count = iteration + 1
+                run_span.set_attribute("iterations", self.iteration_count)
+                
+                logger.info(f"🤠 INFO ========================= STEP {iteration + 1} =========================")
+                
+                try:
+                    final_response = await self._step(user_input, iteration, deadline, on_delta)
+                except asyncio.TimeoutError:
+                    self._checkpoint_interrupted(iteration)
+                    logger.warning(
+                        "agent_timeout",
+                        iterations=self.iteration_count,
+                        timeout_seconds=self.config.timeout_seconds
+                    )
+                    message = "I've run out of time for this task. Here's what I've accomplished so far..."
+                    if on_delta is not None:
+                        on_delta(message)
+                    return message
+                except BaseException:
+                    self._checkpoint_interrupted(iteration)
+                    raise
+                
+                if final_response is None:
+                    continue
                 
                 self.history.append({
                     "role": "assistant",
                     "content": final_response
                 })
+                if self.checkpoint is not None:
+                    self.checkpoint.finish(final_response, self.total_cost)
                 
                 logger.info(
                     "agent_run_complete",
                     iterations=self.iteration_count,
-                    cost=self.total_cost
+                    cost=self.total_cost,
+                    **({f"cache_{k}": v for k, v in self.cache.stats().items()} if self.cache else {})
                 )
                 
                 return final_response
+            
+            # Max iterations reached
+            logger.warning("agent_max_iterations_reached")
+            message = "I've reached my maximum number of steps. Here's what I've accomplished so far..."
+            if on_delta is not None:
+                on_delta(message)
+            return message
+    
+    def _checkpoint_interrupted(self, iteration: int) -> None:
+        """
+        Record the cost spent by a step that did not complete.
+        
+        A resumed run repeats the step, but must not forget what the
+        interrupted attempt already cost.
+        """
+        if self.checkpoint is not None:
+            self.checkpoint.step(iteration, [], self.total_cost)
+    
+    async def _step(
+        self,
+        user_input: str,
+        iteration: int,
+        deadline: float,
+        on_delta: Callable[[str], None] | None
+    ) -> str | None:
+        """
+        Run one iteration: get the LLM response and execute its tool calls.
+        
+        Returns:
+            The final response, or None if tools were called and the loop
+            should continue.
+        
+        Raises:
+            asyncio.TimeoutError: If the run deadline expires during the step.
+        """
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        
+        self.metrics.observe("history_tokens", self.history.total_tokens, TOKEN_BUCKETS)
+        self.metrics.observe("history_messages", len(self.history), COUNT_BUCKETS)
+        
+        with self.tracer.span(
+            "agent.step",
+            iteration=iteration + 1,
+            history_messages=len(self.history),
+            history_tokens=self.history.total_tokens
+        ) as span:
+            try:
+                # Get LLM response
+                response, tool_tasks = await asyncio.wait_for(
+                    self._get_response(user_input, iteration, on_delta),
+                    timeout=max(deadline - loop.time(), 0)
+                )
+                
+                # Log thinking
+                if getattr(response, 'thinking', None):
+                    logger.info(f"💭 THOUGHT: {response.thinking}")
+                
+                # No tool calls, agent wants to respond
+                if not (hasattr(response, 'tool_calls') and response.tool_calls):
+                    return response.content if hasattr(response, 'content') else str(response)
+                
+                # Execute tool calls
+                span.set_attribute("tool_calls", len(response.tool_calls))
+                results = await self._execute_tool_calls(
+                    response.tool_calls,
+                    timeout=deadline - loop.time(),
+                    tasks=tool_tasks
+                )
+                
+                # Results come back in the same order as the tool calls
+                messages = []
+                for tool_call, result in zip(response.tool_calls, results):
+                    logger.info(f"📤 OBSERVATION: {str(result)[:200]}...")
+                    
+                    # Add to history
+                    message = {
+                        "role": "tool",
+                        "name": tool_call.name,
+                        "args": tool_call.args,
+                        "result": result
+                    }
+                    self.history.append(message)
+                    messages.append(message)
+                
+                # The step is complete: a resumed run continues after it
+                if self.checkpoint is not None:
+                    self.checkpoint.step(iteration + 1, messages, self.total_cost)
+                return None
+            finally:
+                self.metrics.observe("step_latency_ms", _elapsed_ms(started))
+    
+    async def _get_response(
+        self,
+        user_input: str,
+        iteration: int,
+        on_delta: Callable[[str], None] | None
+    ) -> tuple[LLMResponse, list[asyncio.Task[dict[str, Any]]] | None]:
+        """
+        Get the LLM response for the current step.
+        
+        Deterministic requests (temperature 0) are served from the response
+        cache when possible. With `llm.racing` enabled, non-streamed steps
+        race the fast model against the configured one (see `_race`).
+        Streams the response when `on_delta` is given.
+        
+        Returns:
+            The response and, when streaming, the tool tasks already started.
+        """
+        with self.tracer.span("llm.call", model=self.config.llm_model) as span:
+            cache_key = None
+            if self.cache is not None and self.config.temperature == 0:
+                cache_key = self.cache.make_key("llm", {
+                    "provider": self.config.llm_provider,
+                    "model": self.config.llm_model,
+                    "max_tokens": self.config.max_tokens,
+                    "system_prompt": self.system_prompt,
+                    "messages": self.history.to_messages(),
+                    "tools": sorted(self.tools),
+                })
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    span.set_attribute("cached", True)
+                    response = LLMResponse.model_validate(cached)
+                    if on_delta is not None and response.content:
+                        on_delta(response.content)
+                    return response, None
+            
+            racing = self.config.racing
+            model = self.config.llm_model
+            if racing.enabled and on_delta is None and racing.fast_model != self.config.llm_model:
+                (response, model), tool_tasks = await self._race(user_input, iteration), None
+            else:
+                response, tool_tasks = await self._request(
+                    self.config.llm_provider, self.config.llm_model, user_input, iteration, on_delta, span
+                )
+            
+            # A fast-model answer must not be served later as the configured model's
+            if cache_key is not None and model == self.config.llm_model:
+                self.cache.set(cache_key, response.model_dump())
+            return response, tool_tasks
+    
+    async def _race(self, user_input: str, iteration: int) -> tuple[LLMResponse, str]:
+        """
+        Send the step to the fast model and the configured model at once.
+        
+        The fast response is used if it arrives first and passes
+        `_accept_fast_response`, and the configured model's request is
+        cancelled; otherwise the configured model's response is used. Both
+        requests count towards `total_cost`: a cancelled one is charged for
+        its prompt tokens, since providers bill input already sent.
+        
+        Returns:
+            The response used and the model that produced it.
+        """
+        racing = self.config.racing
+        fast_provider = racing.fast_provider or self.config.llm_provider
+        contenders = {
+            "fast": (fast_provider, racing.fast_model),
+            "primary": (self.config.llm_provider, self.config.llm_model),
+        }
+        prompt_tokens = self.history.total_tokens + estimate_tokens(self.system_prompt)
+        
+        async def request(provider: str, model: str) -> LLMResponse:
+            with self.tracer.span("llm.race", model=model) as span:
+                response, _ = await self._request(provider, model, user_input, iteration, None, span)
+                return response
+        
+        tasks = {
+            asyncio.create_task(request(provider, model)): name
+            for name, (provider, model) in contenders.items()
+        }
+        winner = None
+        try:
+            pending = set(tasks)
+            while winner is None and pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # The configured model wins ties
+                for task in sorted(done, key=lambda t: tasks[t] != "primary"):
+                    if task.exception() is not None:
+                        logger.warning("llm_race_failed", model=contenders[tasks[task]][1], error=str(task.exception()))
+                    elif tasks[task] == "primary" or self._accept_fast_response(task.result()):
+                        winner = task
+                        break
+        finally:
+            wasted_cost = 0.0
+            for task, name in tasks.items():
+                if not task.done():
+                    task.cancel()
+                    with contextlib.suppress(asyncio.CancelledError):
+                        await task
+                    # Charge the prompt of the cancelled request
+                    provider, model = contenders[name]
+                    wasted_cost += self.providers.cost(provider, model, Usage(input_tokens=prompt_tokens))
+            self._charge(wasted_cost)
+        
+        if winner is None:
+            # Both failed: surface the configured model's error
+            next(task for task, name in tasks.items() if name == "primary").result()
+        
+        winner_model = contenders[tasks[winner]][1]
+        if (span := Tracer.current()) is not None:
+            span.set_attribute("race_winner", winner_model)
+        logger.info("llm_race", winner=winner_model, cancelled_cost=round(wasted_cost, 6))
+        return winner.result(), winner_model
+    
+    def _accept_fast_response(self, response: LLMResponse) -> bool:
+        """
+        Decide whether a fast-model response is good enough to use.
+        
+        By default only tool-selection steps are accepted: every tool call
+        must name a known tool. Final answers are left to the configured
+        model unless `racing.accept_final_answers` is set. Override this for
+        agent-specific checks (e.g. argument schemas).
+        """
+        if not response.tool_calls:
+            return self.config.racing.accept_final_answers and bool(response.content.strip())
+        return all(tool_call.name in self.tools for tool_call in response.tool_calls)
+    
+    async def _request(
+        self,
+        provider: str,
+        model: str,
+        user_input: str,
+        iteration: int,
+        on_delta: Callable[[str], None] | None,
+        span: Span
+    ) -> tuple[LLMResponse, list[asyncio.Task[dict[str, Any]]] | None]:
+        """
+        Make one LLM request to `model`, recording it on `span`.
+        
+        Calls go through the model's rate limiter and are retried with
+        jittered exponential backoff when throttled. The cost of the
+        response is added to `total_cost`.
+        """
+        self._check_budget()
+        rate_limiter = self.providers.rate_limiter(provider, model)
+        prompt_tokens = self.history.total_tokens + estimate_tokens(self.system_prompt)
+        # Steps of runs already in progress go ahead of new runs
+        priority = 0 if iteration > 0 else 1
+        
+        reserved = prompt_tokens + self.config.max_tokens
+        
+        # A stream is only retried before its first delta reaches the caller
+        # or its first tool call starts, so a retry never repeats content
+        # already delivered or a tool (and its side effects) already run
+        delivered = False
+        forward = None
+        if on_delta is not None:
+            def forward(text: str) -> None:
+                nonlocal delivered
+                delivered = True
+                on_delta(text)
+        
+        def dispatched() -> None:
+            nonlocal delivered
+            delivered = True
+        
+        for attempt in range(self.config.max_retries + 1):
+            waited = await rate_limiter.acquire(reserved, priority)
+            self.metrics.observe("rate_limit_wait_ms", waited * 1000)
+            
+            started = time.perf_counter()
+            try:
+                async with self.providers.limiter(provider):
+                    response, tool_tasks = await self._call_llm(
+                        model, user_input, iteration, forward, on_dispatch=dispatched
+                    )
+                rate_limiter.on_success()
+                break
+            except Exception as e:
+                if not is_rate_limited(e) or attempt == self.config.max_retries or delivered:
+                    raise
+                
+                retry_after = retry_after_seconds(e)
+                rate_limiter.on_throttle(retry_after)
+                delay = retry_after or random.uniform(
+                    0, min(self.config.retry_backoff_max, self.config.retry_backoff_base * 2 ** attempt)
+                )
+                logger.warning("llm_rate_limited", model=model, attempt=attempt + 1, retry_in=round(delay, 2))
+                
+                # Retry-After pauses the shared limiter; otherwise back off alone
+                if not retry_after:
+                    await asyncio.sleep(delay)
+                priority = 0
+        
+        latency_ms = _elapsed_ms(started)
+        self.metrics.observe("llm_latency_ms", latency_ms, model=model)
+        if on_delta is None:
+            # Without streaming the first token arrives with the whole response
+            self.metrics.observe("llm_ttft_ms", latency_ms, model=model)
+        
+        # Prefer provider-reported usage; estimate it otherwise
+        if response.usage is None:
+            response.usage = Usage(
+                input_tokens=prompt_tokens,
+                output_tokens=estimate_tokens(
+                    response.content + json.dumps([tc.model_dump() for tc in response.tool_calls])
+                )
+            )
+        await rate_limiter.settle(reserved, response.usage.input_tokens + response.usage.output_tokens)
+        self.metrics.observe("prompt_tokens", response.usage.input_tokens, TOKEN_BUCKETS)
+        self.metrics.observe("completion_tokens", response.usage.output_tokens, TOKEN_BUCKETS)
+        
+        cost = self.providers.cost(provider, model, response.usage)
+        self._charge(cost)
+        
+        span.set_attribute("attempts", attempt + 1)
+        span.set_attribute("latency_ms", round(latency_ms, 3))
+        span.set_attribute("prompt_tokens", response.usage.input_tokens)
+        span.set_attribute("completion_tokens", response.usage.output_tokens)
+        span.set_attribute("cost", round(cost, 6))
+        return response, tool_tasks
+    
+    def _check_budget(self) -> None:
+        """
+        Raise if the run or the shared budget has no cost left.
+        
+        Raises:
+            CostLimitExceeded: If `config.max_cost` or the shared budget is spent.
+        """
+        if self.total_cost >= self.config.max_cost:
+            raise CostLimitExceeded(f"Cost limit ${self.config.max_cost:.2f} reached (${self.total_cost:.4f} spent)")
+        if self.budget is not None and self.budget.exhausted:
+            raise CostLimitExceeded(f"Shared cost budget ${self.budget.max_cost:.2f} reached")
+    
+    def _charge(self, cost: float) -> None:
+        """Add the cost of a request to the run and the shared budget."""
+        self.total_cost += cost
+        if self.budget is not None:
+            self.budget.charge(cost)
+    
+    async def _call_llm(
+        self,
+        model: str,
+        user_input: str,
+        iteration: int,
+        on_delta: Callable[[str], None] | None,
+        on_dispatch: Callable[[], None] | None = None
+    ) -> tuple[LLMResponse, list[asyncio.Task[dict[str, Any]]] | None]:
+        """
+        Make one LLM request to `model`, streamed when `on_delta` is given.
+        
+        `on_dispatch` is called when a streamed tool call starts executing.
+        """
+        if on_delta is not None:
+            return await self._stream_response(model, user_input, iteration, on_delta, on_dispatch)
+        
+        # response = await self.llm.complete(
+        #     model=model,
+        #     system_prompt=self.system_prompt,
+        #     messages=self.history.to_messages(),
+        #     tools=self.tools,
+        #     temperature=self.config.temperature,
+        #     max_tokens=self.config.max_tokens
+        # )
+        
+        # For template purposes, simulate a response
+        response = LLMResponse.model_validate(
+            await self._simulate_response(user_input, iteration),
+            from_attributes=True
+        )
+        return response, None
+    
+    async def _stream_response(
+        self,
+        model: str,
+        user_input: str,
+        iteration: int,
+        on_delta: Callable[[str], None],
+        on_dispatch: Callable[[], None] | None = None
+    ) -> tuple[LLMResponse, list[asyncio.Task[dict[str, Any]]]]:
+        """
+        Consume a streamed LLM response, dispatching tool calls early.
+        
+        Content deltas are forwarded to `on_delta` as they arrive. Each tool
+        call is started as soon as its arguments parse as complete JSON, so
+        tools run while the rest of the message is still streaming, and
+        `on_dispatch` is called. If the stream fails, tools already started
+        are cancelled and awaited before the error propagates.
+        
+        Returns:
+            The assembled response and the tool tasks already started, in
+            the same order as `response.tool_calls`.
+        """
+        content: list[str] = []
+        buffers: dict[int, _ToolCallBuffer] = {}
+        started: dict[int, tuple[ToolCall, asyncio.Task[dict[str, Any]]]] = {}
+        request_start = time.perf_counter()
+        first_delta = True
+        
+        try:
+            # stream = self.llm.stream(
+            #     model=model,
+            #     system_prompt=self.system_prompt,
+            #     messages=self.history.to_messages(),
+            #     tools=self.tools,
+            #     temperature=self.config.temperature,
+            #     max_tokens=self.config.max_tokens
+            # )
+            stream = self._simulate_stream(user_input, iteration)
+            
+            async for delta in stream:
+                if first_delta:
+                    first_delta = False
+                    ttft_ms = _elapsed_ms(request_start)
+                    self.metrics.observe("llm_ttft_ms", ttft_ms, model=model)
+                    if (span := Tracer.current()) is not None:
+                        span.set_attribute("ttft_ms", round(ttft_ms, 3))
+                
+                if delta.content:
+                    content.append(delta.content)
+                    on_delta(delta.content)
+                
+                for fragment in delta.tool_calls:
+                    buffer = buffers.setdefault(fragment.index, _ToolCallBuffer())
+                    tool_call = buffer.feed(fragment)
+                    if tool_call is not None:
+                        started[fragment.index] = (
+                            tool_call,
+                            asyncio.create_task(self._execute_tool_call(tool_call))
+                        )
+                        if on_dispatch is not None:
+                            on_dispatch()
+            
+            # Tool calls without arguments, or whose arguments never became
+            # valid JSON
+            for index, buffer in buffers.items():
+                if index not in started:
+                    tool_call = ToolCall(id=buffer.id, name=buffer.name)
+                    if buffer.arguments.strip():
+                        coro = self._reject_tool_call(tool_call, buffer.arguments)
+                    else:
+                        coro = self._execute_tool_call(tool_call)
+                    started[index] = (tool_call, asyncio.create_task(coro))
+        except BaseException:
+            tasks = [task for _, task in started.values()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        
+        ordered = [started[index] for index in sorted(started)]
+        response = LLMResponse(
+            content="".join(content),
+            tool_calls=[tool_call for tool_call, _ in ordered]
+        )
+        return response, [task for _, task in ordered]
+    
+    async def _execute_tool_calls(
+        self,
+        tool_calls: list[Any],
+        timeout: float,
+        tasks: list[asyncio.Task[dict[str, Any]]] | None = None
+    ) -> list[dict[str, Any]]:
+        """
+        Execute the tool calls of one step concurrently.
+        
+        Calls are bounded by the global and per-tool semaphores, so with
+        `parallel_tool_calls` disabled they run one at a time. Results are
+        returned in the same order as `tool_calls`. If `timeout` expires,
+        every call still in flight is cancelled before raising.
+        
+        Args:
+            tool_calls: The tool calls requested by the LLM.
+            timeout: Seconds left before the run's deadline.
+            tasks: Tasks already started for `tool_calls` (streaming mode).
+        
+        Raises:
+            asyncio.TimeoutError: If the calls don't finish within `timeout`.
+        """
+        if tasks is None:
+            tasks = [asyncio.ensure_future(self._execute_tool_call(tc)) for tc in tool_calls]
         
-        # Max iterations reached
-        logger.warning("agent_max_iterations_reached")
-        return "I've reached my maximum number of steps. Here's what I've accomplished so far..."
+        return await asyncio.wait_for(asyncio.gather(*tasks), timeout=max(timeout, 0))
+    
+    async def _execute_tool_call(self, tool_call: Any) -> dict[str, Any]:
+        """Execute a single tool call under its concurrency limits."""
+        with self.tracer.span("tool.call", tool=tool_call.name) as span:
+            cacheable = self.tool_cache is not None and tool_call.name in self.config.cacheable_tools
+            epoch = self._tool_cache_epoch
+            cache_key = None
+            if cacheable:
+                cache_key = self.tool_cache.make_key("tool", {
+                    "name": tool_call.name,
+                    "args": tool_call.args,
+                    "epoch": epoch,
+                })
+                cached = self.tool_cache.get(cache_key)
+                if cached is not None:
+                    span.set_attribute("cached", True)
+                    logger.info(f"🎬 ACTION (cached): {tool_call.name}({tool_call.args})")
+                    return cached
+            else:
+                self._tool_cache_epoch += 1
+            
+            # Wait on the per-tool limit first so a throttled tool doesn't hold
+            # one of the global slots while it waits
+            tool_semaphore = self._tool_semaphores.get(tool_call.name, contextlib.nullcontext())
+            queued = time.perf_counter()
+            
+            try:
+                async with tool_semaphore, self._tool_semaphore:
+                    span.set_attribute("queued_ms", round(_elapsed_ms(queued), 3))
+                    logger.info(f"🎬 ACTION: {tool_call.name}({tool_call.args})")
+                    
+                    started = time.perf_counter()
+                    try:
+                        # Execute tool
+                        # result = await self.tools[tool_call.name].execute(**tool_call.args)
+                        result = {"success": True, "data": "Simulated result"}
+                    except Exception as e:
+                        logger.warning("tool_failed", tool=tool_call.name, error=str(e))
+                        result = {"success": False, "error": str(e)}
+                    finally:
+                        self.metrics.observe("tool_latency_ms", _elapsed_ms(started), tool=tool_call.name)
+            finally:
+                # Bumped again once the write is done: reads that ran while it
+                # was in flight are cached under an epoch no later read uses
+                if not cacheable:
+                    self._tool_cache_epoch += 1
+            
+            span.set_attribute("success", result.get("success", True))
+            # A read that overlapped a write may hold pre-write data: not cached
+            if cache_key is not None and result.get("success", True) and epoch == self._tool_cache_epoch:
+                self.tool_cache.set(cache_key, result)
+            return result
+    
+    async def _reject_tool_call(self, tool_call: ToolCall, arguments: str) -> dict[str, Any]:
+        """Report a streamed tool call whose arguments could not be parsed."""
+        logger.warning("tool_call_invalid_arguments", tool=tool_call.name, arguments=arguments[:200])
+        return {"success": False, "error": f"Invalid JSON arguments for {tool_call.name}"}
     
     async def _simulate_response(self, user_input: str, iteration: int) -> Any:
         """Simulate a response for template testing."""
@@ -244,13 +2096,154 @@ class MyAgent:
         await asyncio.sleep(0.1)  # Simulate API latency
         return SimulatedResponse()
     
+    async def _simulate_stream(self, user_input: str, iteration: int) -> AsyncIterator[Any]:
+        """Simulate a streamed response for template testing."""
+        # Deltas follow the OpenAI chunk layout: a piece of content and/or
+        # fragments of tool calls, identified by their index.
+        await asyncio.sleep(0.05)  # Simulate time to first token
+        
+        words = f"This is a simulated response to: {user_input}".split(" ")
+        for i, word in enumerate(words):
+            await asyncio.sleep(0.01)  # Simulate token latency
+            yield SimpleNamespace(content=word if i == 0 else f" {word}", tool_calls=[])
+    
     def get_trajectory(self) -> list[dict[str, Any]]:
-        """Get the full trajectory of the agent run."""
-        return self.history.copy()
+        """Get the full, uncompacted trajectory of the agent run."""
+        return self.history.full_record()
     
     def get_cost(self) -> float:
         """Get the total cost of the agent run."""
         return self.total_cost
+    
+    def get_metrics(self) -> dict[str, dict[str, Any]]:
+        """
+        Get latency, token and history-size histograms for this agent.
+        
+        Per-iteration detail is in the `agent.step`, `llm.call` and
+        `tool.call` spans of `self.tracer.spans`.
+        """
+        return self.metrics.snapshot()
+    
+    def get_cache_stats(self) -> dict[str, Any]:
+        """Get LLM response cache hits/misses (empty if the cache is disabled)."""
+        return self.cache.stats() if self.cache is not None else {}
+
+
+class TaskResult(BaseModel):
+    """Outcome of one task run by `AgentPool.run_many`."""
+    index: int
+    input: str
+    output: str | None = None
+    error: str | None = None
+    cost: float = 0.0
+    iterations: int = 0
+    run_id: str | None = None
+
+
+class AgentPool:
+    """
+    Runs many agent tasks concurrently with isolated per-task state.
+    
+    Each task gets its own agent (history, cost, run_id), while provider
+    connection pools, limiters, per-tool concurrency limits and the
+    response cache are shared by all of them, and all tasks record into
+    the pool's metrics registry. Every task charges a shared cost budget:
+    once it is spent, running tasks fail with `CostLimitExceeded` at their
+    next LLM request and no new tasks are started.
+    
+    Example:
+        >>> async with AgentPool(AgentConfig.from_yaml("config.yaml"), max_total_cost=20.0) as pool:
+        ...     async for result in pool.run_many(prompts, concurrency=20):
+        ...         print(result.index, result.output)
+    """
+    
+    def __init__(
+        self,
+        config: AgentConfig,
+        max_total_cost: float | None = None,
+        agent_cls: type[MyAgent] = MyAgent
+    ):
+        self.config = config
+        self.max_total_cost = max_total_cost
+        self.agent_cls = agent_cls
+        self.budget = CostBudget(max_total_cost)
+        self.providers = ProviderPool.from_yaml(config.models_file)
+        self.cache = ResponseCache.from_config(config.cache) if config.cache.enabled else None
+        self.metrics = MetricsRegistry()
+        self.tool_limits = tool_semaphores(config)
+    
+    async def __aenter__(self) -> "AgentPool":
+        return self
+    
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.providers.aclose()
+    
+    @property
+    def total_cost(self) -> float:
+        return self.budget.spent
+    
+    @property
+    def budget_exhausted(self) -> bool:
+        return self.budget.exhausted
+    
+    async def run_many(
+        self,
+        inputs: Iterable[str],
+        concurrency: int = 10
+    ) -> AsyncIterator[TaskResult]:
+        """
+        Run every input, yielding results as they complete.
+        
+        Results arrive in completion order; use `TaskResult.index` to map
+        them back to `inputs`. Inputs left over when the cost budget runs
+        out are yielded as skipped results with an error.
+        """
+        items = enumerate(inputs)
+        running: set[asyncio.Task[TaskResult]] = set()
+        
+        try:
+            while True:
+                while len(running) < concurrency and not self.budget_exhausted:
+                    item = next(items, None)
+                    if item is None:
+                        break
+                    running.add(asyncio.create_task(self._run_task(*item)))
+                
+                if not running:
+                    break
+                
+                done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+        
+        for index, user_input in items:
+            yield TaskResult(index=index, input=user_input, error="Cost budget exhausted")
+    
+    async def _run_task(self, index: int, user_input: str) -> TaskResult:
+        """Run one input on a fresh agent that shares the pool's resources."""
+        agent = self.agent_cls(
+            self.config,
+            providers=self.providers,
+            cache=self.cache,
+            metrics=self.metrics,
+            tool_limits=self.tool_limits,
+            budget=self.budget
+        )
+        result = TaskResult(index=index, input=user_input)
+        try:
+            result.output = await agent.run(user_input)
+        except Exception as e:
+            logger.warning("pool_task_failed", index=index, error=str(e))
+            result.error = str(e)
+        
+        result.run_id = agent.run_id
+        result.cost = agent.get_cost()
+        result.iterations = agent.iteration_count
+        return result
 
 
 # Example usage
@@ -266,6 +2259,7 @@ async def main():
     # Get metrics
     print(f"Iterations: {agent.iteration_count}")
     print(f"Cost: ${agent.get_cost():.4f}")
+    print(f"Cache: {agent.get_cache_stats()}")
 
 
 if __name__ == "__main__":
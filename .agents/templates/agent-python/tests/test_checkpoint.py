@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+from agent import AgentConfig, CacheConfig, CheckpointConfig, HistoryPolicy, MyAgent, RunCheckpoint
+
+
+class WorkerRestart(Exception):
+    pass
+
+@pytest.fixture
+def config(tmp_path):
+    return AgentConfig(
+        name="test",
+        display_name="Test",
+        description="Checkpoint tests",
+        history=HistoryPolicy(spill_dir=str(tmp_path / "trajectories")),
+        cache=CacheConfig(db_path=None),
+        checkpoint=CheckpointConfig(dir=str(tmp_path / "checkpoints"), fsync=False),
+    )
+
+def test_resume_second_run(config, monkeypatch):
+    agent = MyAgent(config)
+    assert asyncio.run(agent.run("first")).endswith("first")
+    first_run = agent.run_id
+
+    simulate = MyAgent._simulate_response
+    async def interrupted(self, user_input, iteration):
+        raise WorkerRestart
+    monkeypatch.setattr(MyAgent, "_simulate_response", interrupted)
+    with pytest.raises(WorkerRestart):
+        asyncio.run(agent.run("second"))
+    second_run = agent.run_id
+    assert second_run != first_run
+
+    monkeypatch.setattr(MyAgent, "_simulate_response", simulate)
+    resumed = MyAgent(config)
+    assert asyncio.run(resumed.resume(second_run)).endswith("second")
+    assert [m["content"] for m in resumed.get_trajectory()][0] == "second"
+    assert asyncio.run(MyAgent(config).resume(first_run)).endswith("first")
+
+def test_load_keeps_last_run(tmp_path):
+    checkpoint = RunCheckpoint(tmp_path / "run.jsonl", fsync=False)
+    checkpoint.start("first", None)
+    checkpoint.step(0, [{"role": "user", "content": "first"}], 0.0)
+    checkpoint.step(1, [{"role": "assistant", "content": "done"}], 0.5)
+    checkpoint.finish("done", 0.5)
+    checkpoint.start("second", None)
+    checkpoint.step(0, [{"role": "user", "content": "second"}], 0.0)
+
+    state = checkpoint.load()
+    assert state["input"] == "second"
+    assert state["messages"] == [{"role": "user", "content": "second"}]
+    assert state["iteration"] == 0
+    assert state["total_cost"] == 0.0
+    assert state["response"] is None
@@ -4,6 +4,9 @@ class Settings(BaseSettings):
     PROJECT_NAME: str = "LMAgent Project"
     API_V1_STR: str = "/api/v1"
     DATABASE_URL: str = "sqlite:///./dev.db"
+    PROFILING_ENABLED: bool = False
+    PROFILING_TOKEN: str = ""
+    PROFILING_INTERVAL_MS: float = 5.0
     
     class Config:
         case_sensitive = True
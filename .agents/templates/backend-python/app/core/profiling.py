@@ -0,0 +1,152 @@
+"""
+Opt-in server-side profiling (PROFILING_ENABLED=true).
+
+While a session is active (started from the /_profiling endpoints, e.g. by
+profile_endpoint.py --server-profile), a background thread samples every
+thread's stack, and the middleware records per-route timing and SQL query
+counts. Stacks are exported in collapsed format, ready for flamegraph.pl or
+speedscope.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+PREFIX = "/_profiling"
+
+_sql_queries: ContextVar[list[int] | None] = ContextVar("sql_queries", default=None)
+
+
+class Profiler:
+    def __init__(self):
+        self.active = False
+        self.interval = 0.005
+        self.started_at = 0.0
+        self.stopped_at = 0.0
+        self.samples = 0
+        self.stacks: Counter[str] = Counter()
+        self.routes: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def start(self, interval_ms: float = 5.0) -> None:
+        self.stop()
+        with self._lock:
+            self.interval = interval_ms / 1000
+            self.samples = 0
+            self.stacks.clear()
+            self.routes.clear()
+            self.started_at = time.time()
+            self.active = True
+        self._thread = threading.Thread(target=self._sample, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if not self.active:
+            return
+        self.active = False
+        self.stopped_at = time.time()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _sample(self) -> None:
+        own = threading.get_ident()
+        while self.active:
+            frames = sys._current_frames()
+            with self._lock:
+                self.samples += 1
+                for ident, frame in frames.items():
+                    if ident != own:
+                        self.stacks[_collapse(frame)] += 1
+            time.sleep(self.interval)
+
+    def record_route(self, route: str, duration_ms: float, queries: int) -> None:
+        with self._lock:
+            stats = self.routes.setdefault(
+                route, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "sql_queries": 0}
+            )
+            stats["count"] += 1
+            stats["total_ms"] += duration_ms
+            stats["max_ms"] = max(stats["max_ms"], duration_ms)
+            stats["sql_queries"] += queries
+
+    def collapsed(self) -> str:
+        """One `frame;frame;... count` line per distinct stack (root first)."""
+        with self._lock:
+            return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def report(self) -> dict:
+        with self._lock:
+            routes = {
+                route: {
+                    "count": stats["count"],
+                    "mean_ms": round(stats["total_ms"] / stats["count"], 2),
+                    "max_ms": round(stats["max_ms"], 2),
+                    "sql_queries": stats["sql_queries"],
+                    "sql_queries_per_request": round(stats["sql_queries"] / stats["count"], 2),
+                }
+                for route, stats in self.routes.items()
+            }
+            end = time.time() if self.active else self.stopped_at
+            return {
+                "active": self.active,
+                "duration_s": round(end - self.started_at, 2) if self.started_at else 0.0,
+                "interval_ms": self.interval * 1000,
+                "samples": self.samples,
+                "routes": routes,
+            }
+
+
+def _collapse(frame) -> str:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+profiler = Profiler()
+
+
+class ProfilingMiddleware:
+    """Per-route timing and SQL query counts while a profiling session is active."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not profiler.active or scope["path"].startswith(PREFIX):
+            await self.app(scope, receive, send)
+            return
+
+        queries = [0]
+        token = _sql_queries.set(queries)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", scope["path"])
+            profiler.record_route(
+                f"{scope['method']} {path}", (time.perf_counter() - start) * 1000, queries[0]
+            )
+            _sql_queries.reset(token)
+
+
+def _count_query(*args) -> None:
+    queries = _sql_queries.get()
+    if queries is not None:
+        queries[0] += 1
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Count the SQL queries of each profiled request."""
+    if not event.contains(engine, "before_cursor_execute", _count_query):
+        event.listen(engine, "before_cursor_execute", _count_query)
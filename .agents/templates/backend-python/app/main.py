@@ -9,6 +9,18 @@ app = FastAPI(
 )
 
 app.include_router(health.router, tags=["health"])
+
+if settings.PROFILING_ENABLED:
+    if not settings.PROFILING_TOKEN:
+        raise RuntimeError("PROFILING_ENABLED requires PROFILING_TOKEN")
+
+    from app.core.database import engine
+    from app.core.profiling import ProfilingMiddleware, instrument_engine
+    from app.routers import profiling
+
+    app.add_middleware(ProfilingMiddleware)
+    app.include_router(profiling.router, tags=["profiling"])
+    instrument_engine(engine)
 # app.include_router(users.router, prefix=f"{settings.API_V1_STR}/users", tags=["users"])
 
 @app.on_event("startup")
@@ -0,0 +1,36 @@
+import secrets
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from app.core.config import settings
+from app.core.profiling import PREFIX, profiler
+
+
+def require_token(x_profiling_token: str = Header(default="")):
+    # Without a configured token the endpoints stay closed
+    if not settings.PROFILING_TOKEN or not secrets.compare_digest(
+        x_profiling_token.encode(), settings.PROFILING_TOKEN.encode()
+    ):
+        raise HTTPException(status_code=403, detail="Invalid profiling token")
+
+
+router = APIRouter(prefix=PREFIX, dependencies=[Depends(require_token)])
+
+@router.post("/start")
+def start_profiling(interval_ms: float = Query(default=settings.PROFILING_INTERVAL_MS, gt=0)):
+    profiler.start(interval_ms)
+    return profiler.report()
+
+@router.post("/stop")
+def stop_profiling():
+    profiler.stop()
+    return profiler.report()
+
+@router.get("/report")
+def profiling_report():
+    return profiler.report()
+
+@router.get("/stacks", response_class=PlainTextResponse)
+def profiling_stacks():
+    return profiler.collapsed()
@@ -0,0 +1,63 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from app.core.config import settings
+from app.core.profiling import ProfilingMiddleware, instrument_engine
+from app.routers import profiling
+
+engine = create_engine("sqlite://")
+instrument_engine(engine)
+
+app = FastAPI()
+app.add_middleware(ProfilingMiddleware)
+app.include_router(profiling.router)
+
+@app.get("/items/{item_id}")
+def read_item(item_id: int):
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        conn.execute(text("SELECT 2"))
+    return {"id": item_id}
+
+client = TestClient(app, headers={"X-Profiling-Token": "test-token"})
+
+@pytest.fixture(autouse=True)
+def profiling_token(monkeypatch):
+    monkeypatch.setattr(settings, "PROFILING_TOKEN", "test-token")
+
+def test_profiling_session():
+    assert client.post("/_profiling/start", params={"interval_ms": 1}).json()["active"]
+    client.get("/items/1")
+    client.get("/items/2")
+
+    report = client.post("/_profiling/stop").json()
+    route = report["routes"]["GET /items/{item_id}"]
+    assert report["active"] is False
+    assert route["count"] == 2
+    assert route["sql_queries"] == 4
+
+    stacks = client.get("/_profiling/stacks")
+    assert stacks.headers["content-type"].startswith("text/plain")
+    assert stacks.text.strip()
+
+def test_requires_token(monkeypatch):
+    anonymous = TestClient(app)
+    assert anonymous.get("/_profiling/report").status_code == 403
+    assert anonymous.get("/_profiling/report", headers={"X-Profiling-Token": "wrong"}).status_code == 403
+
+    # An unset token closes the endpoints instead of opening them
+    monkeypatch.setattr(settings, "PROFILING_TOKEN", "")
+    assert anonymous.get("/_profiling/report").status_code == 403
+
+def test_rejects_non_positive_interval():
+    assert client.post("/_profiling/start", params={"interval_ms": 0}).status_code == 422
+    assert client.post("/_profiling/start", params={"interval_ms": -5}).status_code == 422
+    assert client.get("/_profiling/report").json()["active"] is False
+
+def test_not_recorded_when_inactive():
+    client.post("/_profiling/start")
+    client.post("/_profiling/stop")
+    client.get("/items/1")
+    assert client.get("/_profiling/report").json()["routes"] == {}